@@ -0,0 +1,207 @@
+"""Organise the transcripts of a backlog of videos with the providers' half-price batch APIs.
+
+A batch can take up to 24 hours, so this runs outside the Streamlit app:
+
+    python -m app.batch_organise submit URL [URL ...] [--urls-file FILE] [--provider openai|anthropic]
+    python -m app.batch_organise collect [BATCH_ID]
+    python -m app.batch_organise run URL [URL ...]
+
+submit sends every chunk of every video as one batch job and records the batch in the batches directory.
+collect writes the organised transcripts of finished batches to the output directory, so it can be run again
+later (for example from cron) until every batch has been collected. run submits and waits for the result.
+The API key is read from OPENAI_API_KEY or ANTHROPIC_API_KEY.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from app.summariser import CLAUDE_MODEL_NAME, get_batch_results, join_batch_results, organise_messages, organise_transcript_batch, split_transcript, submit_batch
+from app.transcript_processor import get_transcript
+from app.youtube_downloader import extract_video_id
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o",
+    "anthropic": CLAUDE_MODEL_NAME,
+}
+API_KEY_VARIABLES = {
+    "openai": "OPENAI_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+}
+BATCHES_DIR = "batches"
+OUTPUT_DIR = "output"
+
+
+def get_api_key(model_provider):
+    api_key = os.environ.get(API_KEY_VARIABLES[model_provider])
+    if not api_key:
+        raise SystemExit(f"Set {API_KEY_VARIABLES[model_provider]} to use the {model_provider} batch API")
+    return api_key
+
+
+def read_urls(urls, urls_file=None):
+    """Return the URLs given on the command line followed by those in urls_file, one per line, skipping duplicates."""
+    if urls_file:
+        with open(urls_file, "r", encoding="utf-8") as file:
+            urls = list(urls) + [line.strip() for line in file if line.strip() and not line.startswith("#")]
+    return list(dict.fromkeys(urls))
+
+
+def transcript_chunks(urls):
+    """Fetch each video's transcript and return {video_id: {'url': url, 'chunks': [...]}}, skipping videos without one."""
+    videos = {}
+    for url in urls:
+        video_id = extract_video_id(url)
+        transcript = get_transcript(video_id)
+        if not transcript:
+            print(f"Skipping {url}: no transcript")
+            continue
+        videos[video_id] = {'url': url, 'chunks': split_transcript(" ".join(entry["text"] for entry in transcript))}
+    return videos
+
+
+def record_path(batch_id, batches_dir=BATCHES_DIR):
+    return os.path.join(batches_dir, f"{batch_id}.json")
+
+
+def write_record(record, batches_dir=BATCHES_DIR):
+    os.makedirs(batches_dir, exist_ok=True)
+    path = record_path(record['batch_id'], batches_dir)
+    # Written under a temporary name first so a crash never leaves a half-written record behind
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(record, file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_records(batch_id=None, batches_dir=BATCHES_DIR):
+    """Return the record of one batch, or of every batch that hasn't been collected yet."""
+    if batch_id:
+        with open(record_path(batch_id, batches_dir), "r", encoding="utf-8") as file:
+            return [json.load(file)]
+    if not os.path.isdir(batches_dir):
+        return []
+    records = []
+    for item in sorted(os.listdir(batches_dir)):
+        if item.endswith(".json"):
+            with open(os.path.join(batches_dir, item), "r", encoding="utf-8") as file:
+                record = json.load(file)
+            if not record.get('collected_at'):
+                records.append(record)
+    return records
+
+
+def submit(urls, model_provider, model, api_key, batches_dir=BATCHES_DIR):
+    """Submit one batch organising every chunk of every video and record it. Returns the record, or None."""
+    videos = transcript_chunks(urls)
+    if not videos:
+        print("No transcripts to organise")
+        return None
+    requests_by_id = {}
+    for video_id, video in videos.items():
+        video['custom_ids'] = [f"{video_id}-chunk-{i}" for i in range(len(video['chunks']))]
+        for custom_id, chunk in zip(video['custom_ids'], video['chunks']):
+            requests_by_id[custom_id] = organise_messages(chunk, model_provider)
+
+    batch_id = submit_batch(requests_by_id, model, api_key, model_provider)
+    record = {
+        'batch_id': batch_id,
+        'model_provider': model_provider,
+        'model': model,
+        'submitted_at': time.time(),
+        'collected_at': None,
+        'videos': {video_id: {'url': video['url'], 'custom_ids': video['custom_ids']} for video_id, video in videos.items()},
+    }
+    write_record(record, batches_dir)
+    print(f"Submitted batch {batch_id} with {len(requests_by_id)} chunks from {len(videos)} videos, recorded in {record_path(batch_id, batches_dir)}")
+    return record
+
+
+def write_results(record, results, output_dir=OUTPUT_DIR):
+    """Write one organised transcript per video of a finished batch.
+
+    Returns the paths written and, for each video missing a result, the custom ids of its failed chunks.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    failed = {}
+    for video_id, video in record['videos'].items():
+        missing = [custom_id for custom_id in video['custom_ids'] if custom_id not in results]
+        if missing:
+            failed[video_id] = missing
+            continue
+        path = os.path.join(output_dir, f"{video_id}-organised.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(join_batch_results(results, video['custom_ids']))
+        paths.append(path)
+    return paths, failed
+
+
+def collect(batch_id=None, batches_dir=BATCHES_DIR, output_dir=OUTPUT_DIR):
+    """Write the results of every finished batch that hasn't been collected and return the paths written.
+
+    Chunks that failed or expired in a finished batch won't come back by asking again, so their custom ids are kept
+    in the record under 'failed' and the videos they belong to are listed to be submitted again.
+    """
+    paths = []
+    for record in read_records(batch_id, batches_dir):
+        results = get_batch_results(record['batch_id'], get_api_key(record['model_provider']), record['model_provider'])
+        if results is None:
+            print(f"Batch {record['batch_id']} is still running")
+            continue
+        written, failed = write_results(record, results, output_dir)
+        print(f"Batch {record['batch_id']} wrote {len(written)} of {len(record['videos'])} transcripts to {output_dir}")
+        if failed:
+            failed_urls = [record['videos'][video_id]['url'] for video_id in failed]
+            print(f"{len(failed)} videos had chunks without a result. Submit them again with:")
+            print(f"    python -m app.batch_organise submit {' '.join(failed_urls)}")
+        record['failed'] = failed
+        record['collected_at'] = time.time()
+        write_record(record, batches_dir)
+        paths += written
+    return paths
+
+
+def run(urls, model_provider, model, api_key, output_dir=OUTPUT_DIR):
+    """Organise each video's transcript in a batch and wait for it, one video at a time."""
+    os.makedirs(output_dir, exist_ok=True)
+    for video_id, video in transcript_chunks(urls).items():
+        organised_transcript = organise_transcript_batch(video['chunks'], model, api_key, model_provider)
+        path = os.path.join(output_dir, f"{video_id}-organised.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(organised_transcript)
+        print(f"Wrote {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Organise YouTube transcripts with the half-price batch APIs.")
+    parser.add_argument("--batches-dir", default=BATCHES_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("submit", "run"):
+        command = commands.add_parser(name)
+        command.add_argument("urls", nargs="*")
+        command.add_argument("--urls-file", help="File with one YouTube URL per line")
+        command.add_argument("--provider", choices=list(DEFAULT_MODELS), default="openai")
+        command.add_argument("--model", help="Defaults to the model the app uses for the provider")
+    collect_command = commands.add_parser("collect")
+    collect_command.add_argument("batch_id", nargs="?", help="Defaults to every batch not collected yet")
+    args = parser.parse_args(argv)
+
+    if args.command == "collect":
+        collect(args.batch_id, args.batches_dir, args.output_dir)
+        return
+
+    urls = read_urls(args.urls, args.urls_file)
+    if not urls:
+        parser.error("give at least one URL or --urls-file")
+    model = args.model or DEFAULT_MODELS[args.provider]
+    api_key = get_api_key(args.provider)
+    if args.command == "submit":
+        submit(urls, args.provider, model, api_key, args.batches_dir)
+    else:
+        run(urls, args.provider, model, api_key, args.output_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
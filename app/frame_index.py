@@ -0,0 +1,289 @@
+import os
+import shutil
+import sys
+import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import streamlit as st
+
+# Frames are kept every couple of seconds, so any screenshot interval can be served without decoding the video again
+INDEX_STEP_SECONDS = 2
+# The stored JPEGs go into the HTML output as they are, so they are sized for reading rather than archiving
+INDEX_FRAME_WIDTH = 640
+INDEX_JPEG_QUALITY = 75
+# Shorter videos are decoded faster in one process than the cost of starting more
+MIN_SHARD_SECONDS = 60
+SHARDS_PER_WORKER = 4
+
+
+def frame_index_paths(video_path):
+    """Return the image strip and table paths stored next to a cached video."""
+    return f"{video_path}.frames", f"{video_path}.frames.npy"
+
+
+class FrameIndex:
+    """Downscaled frames of one video stored as JPEGs back to back in a memory-mapped strip file.
+
+    The table has one row per frame: timestamp in milliseconds, byte offset in the strip and byte length.
+    """
+
+    def __init__(self, strip_path, table_path):
+        table = np.load(table_path, mmap_mode='r')
+        self.timestamps_ms = np.asarray(table[:, 0])
+        self.offsets = table[:, 1]
+        self.lengths = table[:, 2]
+        self.strip = np.memmap(strip_path, dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return len(self.timestamps_ms)
+
+    def nearest(self, seconds):
+        """Return the row of the indexed frame closest to a time in seconds."""
+        target_ms = seconds * 1000
+        position = int(np.searchsorted(self.timestamps_ms, target_ms))
+        if position == 0:
+            return 0
+        if position == len(self):
+            return len(self) - 1
+        before = self.timestamps_ms[position - 1]
+        after = self.timestamps_ms[position]
+        return position - 1 if target_ms - before <= after - target_ms else position
+
+    def jpeg_at(self, seconds):
+        """Return the stored JPEG bytes of the indexed frame closest to a time in seconds."""
+        row = self.nearest(seconds)
+        offset = int(self.offsets[row])
+        return self.strip[offset:offset + int(self.lengths[row])].tobytes()
+
+
+def index_shard(video_path, start_ms, end_ms, step_seconds=INDEX_STEP_SECONDS, frame_width=INDEX_FRAME_WIDTH):
+    """Decode one contiguous part of the video with its own capture handle.
+
+    Returns a list of (timestamp_ms, jpeg_bytes) for a frame every step_seconds from start_ms up to end_ms.
+    Runs in a worker process, so only the small encoded frames are sent back.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Failed to open video file at {video_path}")
+        return []
+    if start_ms > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_ms)
+
+    frames = []
+    next_ms = start_ms
+    while cap.grab():
+        position_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+        if position_ms >= end_ms:
+            break
+        if position_ms < next_ms:
+            continue
+        ret, frame = cap.retrieve()
+        if not ret:
+            continue
+        height, width, _ = frame.shape
+        frame_height = int(frame_width / (float(width) / float(height)))
+        resized_frame = cv2.resize(frame, (frame_width, frame_height), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode('.jpg', resized_frame, [cv2.IMWRITE_JPEG_QUALITY, INDEX_JPEG_QUALITY])
+        if ok:
+            frames.append((int(position_ms), encoded.tobytes()))
+        while next_ms <= position_ms:
+            next_ms += step_seconds * 1000
+    cap.release()
+    return frames
+
+
+def get_video_duration_ms(video_path):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return 0
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    if fps <= 0:
+        return 0
+    return frame_count / fps * 1000
+
+
+def choose_worker_count(duration_ms):
+    """Use every core for long videos, but don't start a worker for less than MIN_SHARD_SECONDS of video."""
+    return max(1, min(os.cpu_count() or 1, int(duration_ms / 1000 // MIN_SHARD_SECONDS)))
+
+
+def plan_shards(duration_ms, workers, step_seconds=INDEX_STEP_SECONDS):
+    """Split the timeline into contiguous (start_ms, end_ms) shards that start on the index step grid.
+
+    There are a few shards per worker so a slow shard doesn't leave the other workers idle at the end.
+    """
+    step_ms = step_seconds * 1000
+    steps = max(1, int(-(-duration_ms // step_ms)))
+    shard_count = min(steps, workers * SHARDS_PER_WORKER if workers > 1 else 1)
+    bounds = [round(steps * i / shard_count) * step_ms for i in range(shard_count + 1)]
+    shards = [(bounds[i], bounds[i + 1]) for i in range(shard_count)]
+    # The last shard runs to the end of the file in case the reported duration is short
+    shards[-1] = (shards[-1][0], float("inf"))
+    return shards
+
+
+_build_locks = {}  # video path -> lock held while its index is being built
+_build_locks_lock = threading.Lock()
+
+
+def build_lock(video_path):
+    """Return the lock that serialises checking for and building one video's index, so it is only built once."""
+    with _build_locks_lock:
+        return _build_locks.setdefault(os.path.abspath(video_path), threading.Lock())
+
+
+def temporary_file(path):
+    """Open a new, uniquely named temporary file next to path for writing and return (file, temporary path).
+
+    The name ends in .tmp, which the video cache leaves alone while the build is still writing it.
+    """
+    fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    return os.fdopen(fd, "wb"), temporary_path
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def build_frame_index(video_path, step_seconds=INDEX_STEP_SECONDS, frame_width=INDEX_FRAME_WIDTH, workers=None):
+    """Decode the video once and write a frame every step_seconds to the index files. Returns None on failure.
+
+    The timeline is split into shards decoded in parallel worker processes and merged in timestamp order.
+    workers defaults to a count chosen from the CPU count and video length.
+    """
+    strip_path, table_path = frame_index_paths(video_path)
+    duration_ms = get_video_duration_ms(video_path)
+    if workers is None:
+        workers = choose_worker_count(duration_ms)
+    shards = plan_shards(duration_ms, workers, step_seconds)
+    print(f"Building frame index for {video_path} with {workers} workers over {len(shards)} shards")
+
+    rows = []
+    offset = 0
+    executor = None
+    temporary_paths = []
+    try:
+        if workers == 1:
+            shard_results = (index_shard(video_path, start_ms, end_ms, step_seconds, frame_width) for start_ms, end_ms in shards)
+        else:
+            # Spawned rather than forked, since forking the multi-threaded Streamlit server can deadlock the workers
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            shard_results = executor.map(index_shard, *zip(*[(video_path, start_ms, end_ms, step_seconds, frame_width) for start_ms, end_ms in shards]))
+
+        # Write to temporary files first so a failed build is never mistaken for a complete index
+        strip, strip_temporary_path = temporary_file(strip_path)
+        temporary_paths.append(strip_temporary_path)
+        with strip:
+            # map returns shards in submission order, which is timestamp order
+            for frames in shard_results:
+                for position_ms, encoded in frames:
+                    strip.write(encoded)
+                    rows.append((position_ms, offset, len(encoded)))
+                    offset += len(encoded)
+
+        if not rows:
+            print(f"No frames could be read from {video_path}")
+            remove_files(temporary_paths)
+            return None
+
+        table_file, table_temporary_path = temporary_file(table_path)
+        temporary_paths.append(table_temporary_path)
+        with table_file:
+            np.save(table_file, np.array(rows, dtype=np.int64))
+        # The table is moved into place last because its presence marks the index as complete
+        os.replace(strip_temporary_path, strip_path)
+        os.replace(table_temporary_path, table_path)
+    except Exception as e:
+        # A worker that crashed (BrokenProcessPool) or raised ends up here, and the caller reads the video directly
+        print(f"Error building frame index for {video_path}: {e}")
+        remove_files(temporary_paths)
+        return None
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print(f"Frame index with {len(rows)} frames written to {strip_path}")
+    return FrameIndex(strip_path, table_path)
+
+
+def load_frame_index(video_path):
+    """Return the finished frame index of a video, or None if it hasn't been built."""
+    strip_path, table_path = frame_index_paths(video_path)
+    # The video cache removes the index together with its video, so an existing index always matches the file
+    if os.path.exists(table_path) and os.path.exists(strip_path):
+        print(f"Using existing frame index for {video_path}")
+        return FrameIndex(strip_path, table_path)
+    return None
+
+
+def load_or_build_frame_index(video_path):
+    """Return the frame index for a video, building it first if it is missing."""
+    frame_index = load_frame_index(video_path)
+    if frame_index is not None:
+        return frame_index
+    # Another session reading the same video waits here and then finds the index it built
+    with build_lock(video_path):
+        frame_index = load_frame_index(video_path)
+        if frame_index is not None:
+            return frame_index
+        st.info("Indexing video frames (only needed the first time a video is processed)...")
+        return build_frame_index(video_path)
+
+
+def write_synthetic_video(video_path, duration_seconds, fps=25, size=(854, 480)):
+    """Write a video of moving noise with a frame counter, for benchmarking."""
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 255, (size[1] * 2, size[0] * 2, 3), dtype=np.uint8)
+    for i in range(int(duration_seconds * fps)):
+        y, x = (i * 7) % size[1], (i * 13) % size[0]
+        frame = noise[y:y + size[1], x:x + size[0]].copy()
+        cv2.putText(frame, str(i), (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
+        writer.write(frame)
+    writer.release()
+
+
+def benchmark_build(video_path=None, duration_seconds=600, max_workers=None):
+    """Time building the index with 1 up to max_workers workers and print the speed-up of each.
+
+    Without a video_path a synthetic video of duration_seconds is written to a temporary directory. A given video
+    is copied there first, so the index stored next to it, such as a cached video's, is never overwritten or removed.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        if video_path is None:
+            benchmark_path = os.path.join(directory, "synthetic.mp4")
+            print(f"Writing a {duration_seconds} second synthetic video...")
+            write_synthetic_video(benchmark_path, duration_seconds)
+        else:
+            benchmark_path = os.path.join(directory, os.path.basename(video_path))
+            shutil.copyfile(video_path, benchmark_path)
+
+        timings = {}
+        for workers in sorted({1, *range(2, max_workers + 1, 2), max_workers}):
+            started = time.time()
+            build_frame_index(benchmark_path, workers=workers)
+            timings[workers] = time.time() - started
+
+    print("workers  seconds  speed-up")
+    for workers, seconds in timings.items():
+        print(f"{workers:>7}  {seconds:>7.2f}  {timings[1] / seconds:>7.2f}x")
+    return timings
+
+
+if __name__ == "__main__":
+    # python -m app.frame_index [video_path] [max_workers]
+    benchmark_build(
+        video_path=sys.argv[1] if len(sys.argv) > 1 else None,
+        max_workers=int(sys.argv[2]) if len(sys.argv) > 2 else None,
+    )
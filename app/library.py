@@ -0,0 +1,183 @@
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+
+DEFAULT_LIBRARY_PATH = "library/readtube.db"
+RESULTS_DIRECTORY = "results"  # Next to the database; holds a copy of each HTML and PDF output
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    author TEXT,
+    description TEXT,
+    summary TEXT,
+    organised_transcript TEXT,
+    processed_at REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    video_id TEXT NOT NULL,
+    segment_length INTEGER NOT NULL,
+    generate_transcript INTEGER NOT NULL,
+    html_path TEXT NOT NULL,
+    html_file_name TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    pdf_file_name TEXT NOT NULL,
+    processed_at REAL,
+    PRIMARY KEY (video_id, segment_length, generate_transcript)
+);
+CREATE TABLE IF NOT EXISTS segments (
+    video_id TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_video_id ON segments (video_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    video_id UNINDEXED,
+    kind UNINDEXED,
+    start UNINDEXED,
+    text,
+    tokenize = 'porter unicode61'
+);
+"""
+
+
+def connect(db_path=DEFAULT_LIBRARY_PATH):
+    """Open the library database, creating it and its tables if needed."""
+    directory = os.path.dirname(db_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def store_result_files(video_id, segment_length, generate_transcript, html_result, db_path=DEFAULT_LIBRARY_PATH):
+    """Copy the HTML and PDF output into the library, named by video and settings, and return their new paths.
+
+    The output directory is cleared before every run, so the library keeps its own copy rather than a path into it.
+    """
+    directory = os.path.join(os.path.dirname(db_path), RESULTS_DIRECTORY)
+    os.makedirs(directory, exist_ok=True)
+    name = f"{video_id}-{segment_length}s-{'transcript' if generate_transcript else 'no-transcript'}"
+    stored = dict(html_result)
+    for kind in ('html', 'pdf'):
+        path = os.path.join(directory, f"{name}.{kind}")
+        # Copied under a temporary name first so a session showing the previous copy never reads half a file
+        shutil.copyfile(html_result[f'{kind}_path'], f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        stored[f'{kind}_path'] = path
+    return stored
+
+
+def save_video(video_id, url, metadata, summary, organised_transcript, segments, segment_length, generate_transcript, html_result=None, db_path=DEFAULT_LIBRARY_PATH):
+    """Store a processed video and make its text searchable, replacing any earlier text for the same video.
+
+    The HTML result is kept per screenshot interval and transcript setting. Returns the stored result with its
+    paths in the library, or None without an html_result.
+    """
+    stored_result = None
+    with closing(connect(db_path)) as conn, conn:
+        if html_result:
+            stored_result = store_result_files(video_id, segment_length, generate_transcript, html_result, db_path)
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    video_id, segment_length, int(generate_transcript),
+                    stored_result['html_path'], stored_result['html_file_name'],
+                    stored_result['pdf_path'], stored_result['pdf_file_name'],
+                    time.time(),
+                ),
+            )
+        conn.execute("DELETE FROM segments WHERE video_id = ?", (video_id,))
+        conn.execute("DELETE FROM search_index WHERE video_id = ?", (video_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO videos (video_id, url, title, author, description, summary, organised_transcript, processed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                video_id, url, metadata['title'], metadata['author'], metadata['description'],
+                summary, organised_transcript, time.time(),
+            ),
+        )
+        conn.executemany(
+            "INSERT INTO segments VALUES (?, ?, ?, ?)",
+            [(video_id, entry['start'], entry['end'], entry['text']) for entry in segments],
+        )
+        search_rows = [
+            (video_id, 'title', None, f"{metadata['title']} {metadata['author']}"),
+            (video_id, 'description', None, metadata['description']),
+            (video_id, 'summary', None, summary),
+        ]
+        if generate_transcript:
+            search_rows.append((video_id, 'transcript', None, organised_transcript))
+        search_rows += [(video_id, 'segment', entry['start'], entry['text']) for entry in segments]
+        conn.executemany("INSERT INTO search_index VALUES (?, ?, ?, ?)", search_rows)
+    print(f"Saved {metadata['title']} to the library with {len(segments)} segments")
+    return stored_result
+
+
+def get_stored_result(video_id, segment_length, generate_transcript, db_path=DEFAULT_LIBRARY_PATH):
+    """Return the paths of a stored HTML result processed with the same settings, in the shape show_html_result expects.
+
+    Returns None if there is no such result or its files have since been removed.
+    """
+    if not os.path.exists(db_path):
+        return None
+    with closing(connect(db_path)) as conn:
+        row = conn.execute(
+            """
+            SELECT results.*, videos.title, videos.author, videos.description
+            FROM results JOIN videos ON videos.video_id = results.video_id
+            WHERE results.video_id = ? AND results.segment_length = ? AND results.generate_transcript = ?
+            """,
+            (video_id, segment_length, int(generate_transcript)),
+        ).fetchone()
+    if row is None or not os.path.exists(row['html_path']) or not os.path.exists(row['pdf_path']):
+        return None
+    return {
+        'html_path': row['html_path'],
+        'html_file_name': row['html_file_name'],
+        'pdf_path': row['pdf_path'],
+        'pdf_file_name': row['pdf_file_name'],
+        'metadata': {'title': row['title'], 'author': row['author'], 'description': row['description']},
+    }
+
+
+def search(query, limit=20, db_path=DEFAULT_LIBRARY_PATH):
+    """Full-text search over every stored video, best matches first, with a YouTube link to the matching moment."""
+    if not query.strip() or not os.path.exists(db_path):
+        return []
+    # Quote each word so punctuation in the query isn't read as FTS5 syntax
+    match = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+    with closing(connect(db_path)) as conn:
+        rows = conn.execute(
+            """
+            SELECT search_index.video_id, search_index.kind, search_index.start,
+                   snippet(search_index, 3, '**', '**', '...', 16) AS snippet,
+                   videos.title, videos.url
+            FROM search_index JOIN videos ON videos.video_id = search_index.video_id
+            WHERE search_index MATCH ?
+            ORDER BY bm25(search_index)
+            LIMIT ?
+            """,
+            (match, limit),
+        ).fetchall()
+
+    results = []
+    for row in rows:
+        youtube_link = row['url']
+        if row['start'] is not None:
+            youtube_link = f"{row['url']}&t={int(row['start'])}s"
+        results.append({
+            'video_id': row['video_id'],
+            'title': row['title'],
+            'kind': row['kind'],
+            'start': row['start'],
+            'snippet': row['snippet'],
+            'youtube_link': youtube_link,
+        })
+    return results
@@ -0,0 +1,227 @@
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from app.summariser import stream_completion_text
+
+LATENCY_WINDOW = 100  # Number of recent requests each route keeps latency samples for
+MIN_HEDGE_SAMPLES = 5  # A route needs this many samples before its percentile is trusted for hedging
+ERROR_BACKOFF_SECONDS = 30  # A failing route is skipped this long, doubling with each further error in a row
+MAX_ERROR_BACKOFF_SECONDS = 600
+
+
+class Route:
+    """One provider, model and API key that requests can be sent to, with its recent latency samples."""
+
+    def __init__(self, name, model_provider, model, api_key, weight=1, base_url=None):
+        self.name = name
+        self.model_provider = model_provider
+        self.model = model
+        self.api_key = api_key
+        self.weight = weight
+        self.base_url = base_url
+        self.ttft_samples = deque(maxlen=LATENCY_WINDOW)  # Seconds until the first piece of text arrived
+        self.duration_samples = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.errors = 0
+        self.hedges_started = 0
+        self.hedges_won = 0
+        self.cancelled = 0
+        self.consecutive_errors = 0
+        self.backoff_until = 0  # time.time() before which the route is only used if every other route is failing too
+        self._lock = threading.Lock()
+
+    def record(self, ttft=None, duration=None, error=False, cancelled=False):
+        with self._lock:
+            if ttft is not None:
+                self.ttft_samples.append(ttft)
+            if duration is not None:
+                self.duration_samples.append(duration)
+            if error:
+                self.errors += 1
+                self.consecutive_errors += 1
+                backoff = min(MAX_ERROR_BACKOFF_SECONDS, ERROR_BACKOFF_SECONDS * 2 ** (self.consecutive_errors - 1))
+                self.backoff_until = time.time() + backoff
+            elif ttft is not None:
+                # Any text at all shows the route is working again
+                self.consecutive_errors = 0
+                self.backoff_until = 0
+            if cancelled:
+                self.cancelled += 1
+
+    def backing_off(self):
+        """Whether the route failed recently enough that it should be skipped."""
+        return time.time() < self.backoff_until
+
+    def ttft_percentile(self, percentile):
+        """Return the given percentile of time to first token in seconds, or None without any samples."""
+        with self._lock:
+            samples = sorted(self.ttft_samples)
+        if not samples:
+            return None
+        position = min(len(samples) - 1, int(round(percentile / 100 * (len(samples) - 1))))
+        return samples[position]
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'hedges_started': self.hedges_started,
+            'hedges_won': self.hedges_won,
+            'cancelled': self.cancelled,
+            'consecutive_errors': self.consecutive_errors,
+            'p50_ttft': self.ttft_percentile(50),
+            'p90_ttft': self.ttft_percentile(90),
+            'samples': len(self.ttft_samples),
+        }
+
+
+class Router:
+    """Spread streaming requests across several routes and hedge requests that are slow to start.
+
+    strategy is "weighted" (random by route weight) or "least_latency" (lowest median time to first token,
+    trying routes without samples first). If the first piece of text hasn't arrived after the chosen route's
+    hedge_percentile time to first token, the same request is sent to another route and whichever starts
+    answering first is used. The other one is cancelled. A route that fails is skipped for a while, for longer
+    after each error in a row.
+    """
+
+    def __init__(self, routes, strategy="least_latency", hedge_percentile=90, min_hedge_samples=MIN_HEDGE_SAMPLES):
+        if not routes:
+            raise ValueError("Router needs at least one route")
+        if strategy not in ("weighted", "least_latency"):
+            raise ValueError(f"Unsupported routing strategy: {strategy}")
+        self.routes = routes
+        self.strategy = strategy
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+
+    def choose(self, exclude=()):
+        candidates = [route for route in self.routes if route not in exclude]
+        if not candidates:
+            return None
+        # A route that keeps failing never gets a time to first token, so without this it would look unmeasured
+        # and be tried first every time. It is tried again once its backoff ends, or if every route is failing.
+        healthy = [route for route in candidates if not route.backing_off()]
+        if not healthy:
+            return min(candidates, key=lambda route: route.backoff_until)
+        candidates = healthy
+        if self.strategy == "weighted":
+            return random.choices(candidates, weights=[route.weight for route in candidates])[0]
+        unmeasured = [route for route in candidates if not route.ttft_samples]
+        if unmeasured:
+            return unmeasured[0]
+        return min(candidates, key=lambda route: route.ttft_percentile(50))
+
+    def hedge_delay(self, route):
+        """Seconds to wait for the first piece of text before hedging, or None if the route has too few samples."""
+        if len(self.routes) < 2 or len(route.ttft_samples) < self.min_hedge_samples:
+            return None
+        return route.ttft_percentile(self.hedge_percentile)
+
+    def stats(self):
+        return {route.name: route.stats() for route in self.routes}
+
+    def stream(self, build_messages):
+        """Yield the text of one completion. build_messages(model_provider) returns the messages for a route's provider."""
+        events = queue.Queue()
+        cancel_events = {}
+
+        def start(route, hedge=False):
+            with route._lock:
+                route.requests += 1
+                if hedge:
+                    route.hedges_started += 1
+            cancel_events[route] = threading.Event()
+            threading.Thread(target=self._run_attempt, args=(route, build_messages(route.model_provider), events, cancel_events[route]), daemon=True).start()
+
+        try:
+            primary = self.choose()
+            start(primary)
+            started = time.time()
+            hedge_delay = self.hedge_delay(primary)
+            failures = []
+            winner = None
+
+            # Wait for the first piece of text from any attempt, hedging once if the primary is slow to start
+            while winner is None:
+                timeout = None
+                if hedge_delay is not None and len(cancel_events) == 1:
+                    timeout = max(0, started + hedge_delay - time.time())
+                try:
+                    route, piece = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge = self.choose(exclude=cancel_events.keys())
+                    print(f"No text from {primary.name} after {hedge_delay:.2f}s, hedging with {hedge.name}")
+                    start(hedge, hedge=True)
+                    continue
+                if isinstance(piece, Exception) or piece is None:
+                    # This attempt failed or finished without any text
+                    failures.append(piece)
+                    if len(failures) < len(cancel_events):
+                        continue
+                    fallback = self.choose(exclude=cancel_events.keys())
+                    if isinstance(piece, Exception) and fallback is not None:
+                        print(f"{route.name} failed, retrying with {fallback.name}")
+                        start(fallback)
+                        continue
+                    if isinstance(piece, Exception):
+                        raise piece
+                    return
+                winner = route
+                if route is not primary:
+                    with route._lock:
+                        route.hedges_won += 1
+                for other, cancel in cancel_events.items():
+                    if other is not winner:
+                        cancel.set()
+                yield piece
+
+            while True:
+                route, piece = events.get()
+                if route is not winner:
+                    continue
+                if piece is None:
+                    return
+                if isinstance(piece, Exception):
+                    raise piece
+                yield piece
+        finally:
+            # Stop every attempt still streaming when this generator is closed early, finishes or fails
+            for cancel in cancel_events.values():
+                cancel.set()
+
+    def _run_attempt(self, route, messages, events, cancel):
+        """Stream one attempt on a worker thread, putting (route, piece) on the queue and (route, None) at the end.
+
+        A cancelled attempt stops at its next piece of text and closes its stream. One still waiting for its first
+        piece can't be interrupted, so it notices the cancel once that piece arrives.
+        """
+        started = time.time()
+        ttft = None
+        # With another route to fail over to, an attempt isn't retried, so a failing route fails over at once and a
+        # retry's wait never counts as time to first token. A lone route has nothing to fail over to, so it retries.
+        retries = len(self.routes) < 2
+        pieces = stream_completion_text(route.model, messages, route.api_key, route.model_provider, base_url=route.base_url, retries=retries)
+        try:
+            for piece in pieces:
+                if ttft is None:
+                    ttft = time.time() - started
+                if cancel.is_set():
+                    pieces.close()
+                    # A loser's time to first token is still a real sample, so slow routes show up in the statistics
+                    route.record(ttft=ttft, cancelled=True)
+                    return
+                events.put((route, piece))
+        except Exception as e:
+            print(f"Error streaming from {route.name}: {str(e)}")
+            route.record(ttft=ttft, error=True)
+            events.put((route, e))
+            return
+        if cancel.is_set():
+            route.record(ttft=ttft, cancelled=True)
+        else:
+            route.record(ttft=ttft, duration=time.time() - started)
+        events.put((route, None))
@@ -9,6 +9,9 @@ from datetime import datetime
 from anthropic import Anthropic
 import anthropic
 import requests
+import json
+import queue
+import threading
 
 # Set up the Anthropic API client
 client = Anthropic()
@@ -16,6 +19,39 @@ CLAUDE_MODEL_NAME = "claude-3-opus-20240229"
 
 enc = tiktoken.encoding_for_model("gpt-4")
 
+SYSTEM_PROMPTS = {
+    "openai": "You are a helpful assistant.",
+    "anthropic": "You are a very skilled writer and communicator.",
+}
+
+# The instructions are the same for every chunk, so they come first and the chunk text last to make a cacheable prefix
+ORGANISE_INSTRUCTIONS = {
+    "openai": "Split this YouTube video transcript into very short readable paragraphs. Only return the text with no other messages. Be diligent and ensure to return every word of the transcript but still correct spelling, typos and ensure correct capitalisation. Finally, detect multiple short paragraphs that are related and add a plain text subheading before them that summarises the main topics. : ",
+    "anthropic": "1) Split this YouTube video transcript into very short readable paragraphs. 2) Return every word of the transcript while correcting spelling, typos and correcting capitalisation. 3) Add a **Heading** before related paragraphs that summarise the topics in them 4) Return only the **Heading** and the paragraphs and no other messages : ",
+}
+
+TRANSCRIPT_CHUNK_TOKENS = 3500
+BATCH_POLL_SECONDS = 30
+
+def split_transcript(text):
+    """Split transcript text into the chunks that are organised one request at a time."""
+    text_splitter = TokenTextSplitter(chunk_size=TRANSCRIPT_CHUNK_TOKENS, chunk_overlap=0)
+    return text_splitter.split_text(text)
+
+def organise_messages(chunk, model_provider):
+    """Build the messages asking the model to organise one transcript chunk."""
+    if model_provider == "openai":
+        # OpenAI caches repeated prompt prefixes automatically
+        return [{"role": "system", "content": SYSTEM_PROMPTS["openai"]}, {"role": "user", "content": ORGANISE_INSTRUCTIONS["openai"] + chunk}]
+    elif model_provider == "anthropic":
+        # Mark the system prompt and instructions as a cacheable prefix so later chunks reuse it
+        return [{"role": "user", "content": [
+            {"type": "text", "text": ORGANISE_INSTRUCTIONS["anthropic"], "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": chunk},
+        ]}]
+    else:
+        raise ValueError(f"Unsupported model provider: {model_provider}")
+
 def summarize_web_page(url, api_key, max_input_tokens=150000, max_output_tokens=4000):
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
@@ -64,26 +100,31 @@ def summarize_web_page(url, api_key, max_input_tokens=150000, max_output_tokens=
         st.error(f"Error generating summary: {str(e)}")
         return None
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def completion_with_backoff(model, messages, api_key, stream=False, model_provider="openai"):
-    """Retry the completion function with exponential backoff."""
+def create_completion(model, messages, api_key, stream=False, model_provider="openai", base_url=None, max_retries=None):
+    """Call the completion function once. base_url overrides the provider's API endpoint.
+
+    max_retries is passed to the provider's client, which otherwise retries failed requests itself.
+    """
     print(f"Model Provider: {model_provider}")
     print(f"API Key: {api_key[:5]}...")  # Print only the first 5 characters of the API key for security
-    
+    client_options = {"api_key": api_key, "base_url": base_url}
+    if max_retries is not None:
+        client_options["max_retries"] = max_retries
+
     try:
         if model_provider == "openai":
             print("Calling OpenAI API...")
-            client = openai.OpenAI(api_key=api_key)
+            client = openai.OpenAI(**client_options)
             response = client.chat.completions.create(model=model, messages=messages, stream=stream)
             return response
         elif model_provider == "anthropic":
             print("Calling Anthropic API...")
-            client = anthropic.Anthropic(api_key=api_key)
-            stream_manager = client.messages.stream(
+            client = anthropic.Anthropic(**client_options)
+            stream_manager = client.beta.prompt_caching.messages.stream(
                 model=model,
                 max_tokens=4000,
                 temperature=1,
-                system="You are a very skilled writer and communicator.",
+                system=SYSTEM_PROMPTS["anthropic"],
                 messages=messages,
             )
             return stream_manager
@@ -93,6 +134,182 @@ def completion_with_backoff(model, messages, api_key, stream=False, model_provid
         print(f"An unexpected error occurred: {str(e)}")
         raise
 
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def completion_with_backoff(model, messages, api_key, stream=False, model_provider="openai", base_url=None):
+    """Retry the completion function with exponential backoff. base_url overrides the provider's API endpoint."""
+    return create_completion(model, messages, api_key, stream=stream, model_provider=model_provider, base_url=base_url)
+
+def submit_batch(requests_by_id, model, api_key, model_provider="openai"):
+    """Submit one batch job with a request per custom id and return the batch id.
+
+    Not retried, not even by the SDK: if a request times out after the provider accepted it, a retry would start
+    and pay for a second batch.
+    """
+    print(f"Submitting batch of {len(requests_by_id)} requests to {model_provider}...")
+    if model_provider == "openai":
+        client = openai.OpenAI(api_key=api_key, max_retries=0)
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": {"model": model, "messages": messages}})
+            for custom_id, messages in requests_by_id.items()
+        ]
+        batch_file = client.files.create(file=("requests.jsonl", "\n".join(lines).encode()), purpose="batch")
+        batch = client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return batch.id
+    elif model_provider == "anthropic":
+        client = anthropic.Anthropic(api_key=api_key, max_retries=0)
+        batch = client.beta.messages.batches.create(requests=[
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": model,
+                    "max_tokens": 4000,
+                    "temperature": 1,
+                    "system": SYSTEM_PROMPTS["anthropic"],
+                    "messages": messages,
+                },
+            }
+            for custom_id, messages in requests_by_id.items()
+        ])
+        return batch.id
+    else:
+        raise ValueError(f"Unsupported model provider: {model_provider}")
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def get_batch_results(batch_id, api_key, model_provider="openai"):
+    """Return a dict of custom id to response text once the batch has finished, or None while it is still running."""
+    if model_provider == "openai":
+        client = openai.OpenAI(api_key=api_key)
+        batch = client.batches.retrieve(batch_id)
+        if batch.status not in ("completed", "failed", "expired", "cancelled"):
+            return None
+        results = {}
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                if line.strip():
+                    result = json.loads(line)
+                    if result.get("response") and result["response"]["status_code"] == 200:
+                        results[result["custom_id"]] = result["response"]["body"]["choices"][0]["message"]["content"]
+        return results
+    elif model_provider == "anthropic":
+        client = anthropic.Anthropic(api_key=api_key)
+        batch = client.beta.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return None
+        results = {}
+        for result in client.beta.messages.batches.results(batch_id):
+            if result.result.type == "succeeded":
+                results[result.custom_id] = "".join(block.text for block in result.result.message.content if block.type == "text")
+        return results
+    else:
+        raise ValueError(f"Unsupported model provider: {model_provider}")
+
+def run_batch(requests_by_id, model, api_key, model_provider="openai", poll_seconds=BATCH_POLL_SECONDS):
+    """Submit requests as one batch job, wait for it to finish and return a dict of custom id to response text.
+
+    The custom ids only need to be unique, so chunks from several videos can share one batch.
+    Requests that failed are missing from the result.
+    """
+    batch_id = submit_batch(requests_by_id, model, api_key, model_provider)
+    print(f"Batch {batch_id} submitted, polling every {poll_seconds} seconds")
+    started = time.time()
+    while True:
+        results = get_batch_results(batch_id, api_key, model_provider)
+        if results is not None:
+            print(f"Batch {batch_id} finished after {format_time(time.time() - started)} with {len(results)} of {len(requests_by_id)} results")
+            return results
+        time.sleep(poll_seconds)
+
+def organise_transcript_batch(texts, model_choice, api_key, model_provider, poll_seconds=BATCH_POLL_SECONDS):
+    """Organise every transcript chunk in one batch job and join the results in chunk order."""
+    requests_by_id = {f"chunk-{i}": organise_messages(chunk, model_provider) for i, chunk in enumerate(texts)}
+    results = run_batch(requests_by_id, model_choice, api_key, model_provider, poll_seconds)
+    return join_batch_results(results, requests_by_id)
+
+def join_batch_results(results, custom_ids):
+    """Join the response texts of the given custom ids in order, raising if any of them failed."""
+    missing = [custom_id for custom_id in custom_ids if custom_id not in results]
+    if missing:
+        raise RuntimeError(f"Batch finished without results for {', '.join(missing)}")
+    return "".join(results[custom_id] for custom_id in custom_ids)
+
+def stream_completion_text(model_choice, messages, api_key, model_provider, base_url=None, retries=True):
+    """Yield the text of a streamed completion piece by piece for either provider.
+
+    Closing the generator early closes the underlying HTTP stream. With retries=False a failed request raises
+    straight away instead of being retried by tenacity or the provider's client, for callers that fail over instead.
+    """
+    def start_completion():
+        if retries:
+            return completion_with_backoff(model_choice, messages, api_key, stream=True, model_provider=model_provider, base_url=base_url)
+        return create_completion(model_choice, messages, api_key, stream=True, model_provider=model_provider, base_url=base_url, max_retries=0)
+
+    if model_provider == "openai":
+        response = start_completion()
+        try:
+            for resp in response:
+                if resp.choices and resp.choices[0].delta.content is not None:
+                    yield resp.choices[0].delta.content
+        finally:
+            response.close()
+    elif model_provider == "anthropic":
+        stream_manager = start_completion()
+        with stream_manager as stream:
+            for text in stream.text_stream:
+                yield text
+    else:
+        raise ValueError(f"Unsupported model provider: {model_provider}")
+
+def stream_text(model_choice, build_messages, api_key, model_provider, router=None):
+    """Stream through the router when one is given, otherwise straight from the chosen provider.
+
+    build_messages(model_provider) returns the messages for a provider, since the router may pick any of them.
+    """
+    if router is not None:
+        return router.stream(build_messages)
+    return stream_completion_text(model_choice, build_messages(model_provider), api_key, model_provider)
+
+def send_stream_events(source, pieces, events, stop=None):
+    """Put each piece of text on the queue tagged with its source, then None when done or the exception if it failed.
+
+    Once stop is set the stream is closed at its next piece, since nobody is reading the queue any more.
+    """
+    try:
+        for piece in pieces:
+            if stop is not None and stop.is_set():
+                pieces.close()
+                return
+            events.put((source, piece))
+    except Exception as e:
+        print(f"Error streaming {source}: {str(e)}")
+        events.put((source, e))
+    events.put((source, None))
+
+def build_summary_messages(summary_prompt, model_provider):
+    if model_provider == "openai":
+        return [{"role": "system", "content": SYSTEM_PROMPTS["openai"]}, {"role": "user", "content": summary_prompt}]
+    return [{"role": "user", "content": summary_prompt}]
+
+def build_summary_prompt(metadata, transcript):
+    return (
+        f"Title: {metadata['title']}\n"
+        f"Author: {metadata['author']}\n"
+        f"Description: {metadata['description']}\n"
+        f"Transcript: {transcript}\n"
+        f"Briefly summarise this YouTube video in one paragraph with UK spelling and without adjectives. Followed by numbered bullets of its key points."
+    )
+
+def show_costs(send_cost_transcript, receive_cost_transcript, send_cost_summary, receive_cost_summary):
+    # Calculating total cost
+    total_cost = send_cost_transcript + receive_cost_transcript + send_cost_summary + receive_cost_summary
+
+    st.info(f"Transcript Send Cost: ${send_cost_transcript:.2f}")
+    st.info(f"Transcript Receive Cost: ${receive_cost_transcript:.2f}")
+    st.info(f"Summary Send Cost: ${send_cost_summary:.2f}")
+    st.info(f"Summary Receive Cost: ${receive_cost_summary:.2f}")
+
+    # Display total cost
+    st.info(f"Total Cost: ${total_cost:.2f}")
+
 def format_time(seconds):
     """Format time in minutes and seconds."""
     minutes = int(seconds // 60)
@@ -108,13 +325,12 @@ def estimate_text_area_height(text):
     minimum_height = 300  # Set a reasonable minimum height
     return max(minimum_height, lines * line_height)  # Return the larger of calculated height or minimum height
 
-def get_summary(text, metadata, model_choice, api_key, generate_transcript, model_provider):
+def get_summary(text, metadata, model_choice, api_key, generate_transcript, model_provider, router=None):
     print(f"Model Provider: {model_provider}")
     print(f"Model Choice: {model_choice}")
     st.info("Starting process to send transcript to OpenAI or Anthropic to organise transcript and generate a summary.")
 
-    text_splitter = TokenTextSplitter(chunk_size=3500, chunk_overlap=0)
-    texts = text_splitter.split_text(text)
+    texts = split_transcript(text)
 
     organised_transcript = ""
     summary = ""
@@ -133,8 +349,17 @@ def get_summary(text, metadata, model_choice, api_key, generate_transcript, mode
         for chunk in texts:
             token_count_send = len(enc.encode(chunk))
             send_cost_transcript += token_count_send / 1_000_000 * 5.00  # Updated cost rate for input tokens
-            if model_provider == "openai":
-                for resp in completion_with_backoff(model_choice, [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": f"Split this YouTube video transcript into very short readable paragraphs. Only return the text with no other messages. Be diligent and ensure to return every word of the transcript but still correct spelling, typos and ensure correct capitalisation. Finally, detect multiple short paragraphs that are related and add a plain text subheading before them that summarises the main topics. : {chunk}"}], api_key, stream=True, model_provider=model_provider):
+            if router is not None:
+                # The router picks a provider per chunk, so the messages are built for whichever one it picks
+                for piece in router.stream(lambda provider: organise_messages(chunk, provider)):
+                    organised_transcript += piece
+                    height = estimate_text_area_height(organised_transcript)
+                    chunk_key = f"chunk_{chunk_count}"  # Unique key for each chunk
+                    organised_transcript_placeholder.text_area("Transcript split into paragraphs", organised_transcript, height=height, key=chunk_key)
+                    chunk_count += 1  # Increment the chunk counter
+
+            elif model_provider == "openai":
+                for resp in completion_with_backoff(model_choice, organise_messages(chunk, model_provider), api_key, stream=True, model_provider=model_provider):
                     if resp.choices[0].delta.content is not None:
                         organised_transcript += resp.choices[0].delta.content
                         last_finish_reason = resp.choices[0].finish_reason or last_finish_reason
@@ -149,7 +374,7 @@ def get_summary(text, metadata, model_choice, api_key, generate_transcript, mode
             elif model_provider == "anthropic":
                 stream_manager = completion_with_backoff(
                     model_choice,
-                    [{"role": "user", "content": f"1) Split this YouTube video transcript into very short readable paragraphs. 2) Return every word of the transcript while correcting spelling, typos and correcting capitalisation. 3) Add a **Heading** before related paragraphs that summarise the topics in them 4) Return only the **Heading** and the paragraphs and no other messages : {chunk}"}],
+                    organise_messages(chunk, model_provider),
                     api_key,
                     stream=True,
                     model_provider=model_provider,
@@ -172,13 +397,7 @@ def get_summary(text, metadata, model_choice, api_key, generate_transcript, mode
         organised_transcript = "Returning the transcript organised into readable paragraphs was not selected."
         organised_transcript_placeholder.text_area("Transcript split into paragraphs returning from GPT4-o or Claude Opus3", organised_transcript)
 
-    summary_prompt = (
-        f"Title: {metadata['title']}\n"
-        f"Author: {metadata['author']}\n"
-        f"Description: {metadata['description']}\n"
-        f"Transcript: {organised_transcript}\n"
-        f"Briefly summarise this YouTube video in one paragraph with UK spelling and without adjectives. Followed by numbered bullets of its key points."
-    )
+    summary_prompt = build_summary_prompt(metadata, organised_transcript)
 
     word_count_send_summary = len(summary_prompt.split())
     token_count_send_summary = len(enc.encode(summary_prompt))
@@ -188,8 +407,14 @@ def get_summary(text, metadata, model_choice, api_key, generate_transcript, mode
     summary_placeholder = st.empty()
 
     # Stream the summary
-    if model_provider == "openai":
-        for resp in completion_with_backoff(model_choice, [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": summary_prompt}], api_key, stream=True, model_provider=model_provider):
+    if router is not None:
+        for piece in router.stream(lambda provider: build_summary_messages(summary_prompt, provider)):
+            summary += piece
+            height = estimate_text_area_height(summary)
+            summary_placeholder.text_area("YouTube video summary", summary, height=int(height))
+
+    elif model_provider == "openai":
+        for resp in completion_with_backoff(model_choice, [{"role": "system", "content": SYSTEM_PROMPTS["openai"]}, {"role": "user", "content": summary_prompt}], api_key, stream=True, model_provider=model_provider):
             if resp.choices[0].delta.content is not None:
                 summary += resp.choices[0].delta.content
                 height = estimate_text_area_height(summary)
@@ -212,15 +437,85 @@ def get_summary(text, metadata, model_choice, api_key, generate_transcript, mode
     completion_tokens_used_summary = len(enc.encode(summary))
     receive_cost_summary = completion_tokens_used_summary / 1_000_000 * 15.00  # Updated cost rate for output tokens
 
-    # Calculating total cost
-    total_cost = send_cost_transcript + receive_cost_transcript + send_cost_summary + receive_cost_summary
+    show_costs(send_cost_transcript, receive_cost_transcript, send_cost_summary, receive_cost_summary)
 
-    st.info(f"Transcript Send Cost: ${send_cost_transcript:.2f}")
-    st.info(f"Transcript Receive Cost: ${receive_cost_transcript:.2f}")
-    st.info(f"Summary Send Cost: ${send_cost_summary:.2f}")
-    st.info(f"Summary Receive Cost: ${receive_cost_summary:.2f}")
+    return organised_transcript, summary
 
-    # Display total cost
-    st.info(f"Total Cost: ${total_cost:.2f}")
+def get_summary_in_parallel(text, metadata, model_choice, api_key, generate_transcript, model_provider, summary_first=True, router=None):
+    """Stream the summary from the raw transcript while the transcript chunks are organised at the same time.
+
+    The summary doesn't wait for the organised transcript, so it starts appearing within seconds.
+    Requests run on worker threads and send text back through a queue, so only this thread touches Streamlit.
+    """
+    print(f"Model Provider: {model_provider}")
+    print(f"Model Choice: {model_choice}")
+    st.info("Generating the summary from the raw transcript while the transcript is organised.")
+
+    texts = split_transcript(text)
+
+    # Placeholders appear on the page in the order they are created
+    if summary_first:
+        summary_placeholder = st.empty()
+        organised_transcript_placeholder = st.empty()
+    else:
+        organised_transcript_placeholder = st.empty()
+        summary_placeholder = st.empty()
+
+    summary_prompt = build_summary_prompt(metadata, text)
+    send_cost_summary = len(enc.encode(summary_prompt)) / 1_000_000 * 5.00
+
+    events = queue.Queue()
+    stop = threading.Event()
+    summary_pieces = stream_text(model_choice, lambda provider: build_summary_messages(summary_prompt, provider), api_key, model_provider, router)
+    workers = [threading.Thread(target=send_stream_events, args=("summary", summary_pieces, events, stop))]
+
+    send_cost_transcript = 0
+    if generate_transcript:
+        for chunk in texts:
+            send_cost_transcript += len(enc.encode(chunk)) / 1_000_000 * 5.00
+        transcript_events = (
+            piece
+            for chunk in texts
+            for piece in stream_text(model_choice, lambda provider, chunk=chunk: organise_messages(chunk, provider), api_key, model_provider, router)
+        )
+        workers.append(threading.Thread(target=send_stream_events, args=("transcript", transcript_events, events, stop)))
+    else:
+        organised_transcript_placeholder.text_area("Transcript split into paragraphs returning from GPT4-o or Claude Opus3", "Returning the transcript organised into readable paragraphs was not selected.")
+
+    for worker in workers:
+        worker.start()
+
+    summary = ""
+    organised_transcript = ""
+    update_count = 0
+    finished = 0
+    try:
+        while finished < len(workers):
+            source, piece = events.get()
+            if piece is None:
+                finished += 1
+            elif isinstance(piece, Exception):
+                raise piece
+            elif source == "summary":
+                summary += piece
+                summary_placeholder.text_area("YouTube video summary", summary, height=int(estimate_text_area_height(summary)))
+            else:
+                organised_transcript += piece
+                update_count += 1
+                organised_transcript_placeholder.text_area("Transcript split into paragraphs", organised_transcript, height=estimate_text_area_height(organised_transcript), key=f"parallel_chunk_{update_count}")
+    finally:
+        # If one stream failed or the script was stopped by a rerun, the other worker stops instead of streaming on
+        stop.set()
+
+    if generate_transcript:
+        completion_tokens_used_transcript = len(enc.encode(organised_transcript))
+        st.info(f"Count of organised transcript tokens received: {completion_tokens_used_transcript:,}")
+        receive_cost_transcript = completion_tokens_used_transcript / 1_000_000 * 15.00
+    else:
+        receive_cost_transcript = 0
+        organised_transcript = "Returning the transcript organised into readable paragraphs was not selected."
+    receive_cost_summary = len(enc.encode(summary)) / 1_000_000 * 15.00
+
+    show_costs(send_cost_transcript, receive_cost_transcript, send_cost_summary, receive_cost_summary)
 
     return organised_transcript, summary
@@ -0,0 +1,130 @@
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+
+DEFAULT_CACHE_DIR = "downloads"
+# Total disk space the downloaded videos may use before the least recently used ones are removed
+DEFAULT_BUDGET_BYTES = int(os.environ.get("READTUBE_VIDEO_CACHE_BYTES", 2 * 1024 ** 3))
+
+
+class VideoCache:
+    """Disk cache of downloaded videos keyed by video id and download format, with LRU eviction."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.budget_bytes = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._in_use = {}  # video path -> number of readers currently holding it
+        self._download_locks = {}  # video path -> lock held while that video is being downloaded
+
+    def path_for(self, video_id, video_format):
+        """Return the cache file path for a video id downloaded in the given format."""
+        format_hash = hashlib.sha1(video_format.encode()).hexdigest()[:10]
+        return os.path.join(self.cache_dir, f"{video_id}-{format_hash}.mp4")
+
+    def get(self, video_id, video_format):
+        """Return the cached video path and mark it as recently used, or None on a miss."""
+        video_path = self.path_for(video_id, video_format)
+        with self._lock:
+            if os.path.exists(video_path):
+                self.hits += 1
+                os.utime(video_path)  # The modification time records when the file was last used
+                print(f"Video cache hit for {video_id} ({self.hits} hits, {self.misses} misses)")
+                return video_path
+            self.misses += 1
+            print(f"Video cache miss for {video_id} ({self.hits} hits, {self.misses} misses)")
+            return None
+
+    def put(self, video_path):
+        """Record a freshly downloaded video and evict old videos if the budget is exceeded."""
+        with self._lock:
+            if os.path.exists(video_path):
+                os.utime(video_path)
+            self._evict()
+
+    def download_lock(self, video_id, video_format):
+        """Return the lock that serialises looking up and downloading one video, so it is only downloaded once."""
+        video_path = self.path_for(video_id, video_format)
+        with self._lock:
+            return self._download_locks.setdefault(video_path, threading.Lock())
+
+    @contextmanager
+    def in_use(self, video_id, video_format):
+        """Hold a video so it can't be evicted while it is being downloaded or read."""
+        video_path = self.path_for(video_id, video_format)
+        with self._lock:
+            self._in_use[video_path] = self._in_use.get(video_path, 0) + 1
+        try:
+            yield video_path
+        finally:
+            with self._lock:
+                self._in_use[video_path] -= 1
+                if self._in_use[video_path] == 0:
+                    del self._in_use[video_path]
+
+    def stats(self):
+        """Return hit and miss counts and the disk space currently used."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size_bytes': sum(size for _, size, _, _ in self._entries()),
+                'budget_bytes': self.budget_bytes,
+            }
+
+    def _sidecar_paths(self, video_path, items):
+        # Files derived from a video, such as its frame index, are named after it and share its lifetime.
+        # Temporary files are still being written by the build that owns them, so they are left alone.
+        prefix = os.path.basename(video_path) + "."
+        return [os.path.join(self.cache_dir, item) for item in items if item.startswith(prefix) and not item.endswith('.tmp')]
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        items = os.listdir(self.cache_dir)
+        entries = []
+        for item in items:
+            if item.endswith('.mp4'):
+                path = os.path.join(self.cache_dir, item)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by another session since the directory was listed
+                    continue
+                size = stat.st_size
+                sidecar_paths = []
+                for sidecar_path in self._sidecar_paths(path, items):
+                    try:
+                        size += os.path.getsize(sidecar_path)
+                        sidecar_paths.append(sidecar_path)
+                    except FileNotFoundError:
+                        continue
+                entries.append((path, size, stat.st_mtime, sidecar_paths))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total_size = sum(size for _, size, _, _ in entries)
+        # Oldest first, so the least recently used videos go before newer ones
+        for path, size, _, sidecar_paths in sorted(entries, key=lambda entry: entry[2]):
+            if total_size <= self.budget_bytes:
+                break
+            if path in self._in_use:
+                continue
+            try:
+                for file_path in sidecar_paths + [path]:
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass  # Already removed by another session
+                total_size -= size
+                print(f"Evicted cached video at {path}")
+            except OSError as e:
+                print(f"Error evicting cached video: {e}")
+
+# Shared by every Streamlit session running in this server process
+video_cache = VideoCache()
+
@@ -1,7 +1,12 @@
 import os
 import cv2
 import base64
-from app.summariser import get_summary
+import mimetypes
+from app.summariser import get_summary, get_summary_in_parallel
+from app.frame_index import load_or_build_frame_index
+from app.video_cache import video_cache
+from app.library import save_video
+from app.youtube_downloader import extract_video_id
 import streamlit as st
 import time
 from jinja2 import Environment, FileSystemLoader
@@ -12,41 +17,87 @@ def clear_output_directory(directory_path):
         if item.endswith('.html'):
             os.remove(os.path.join(directory_path, item))
             
+@st.cache_resource
+def get_pdfkit_configuration():
+    # Configure pdfkit with the wkhtmltopdf executable path inside the devcontainer
+    return pdfkit.configuration(wkhtmltopdf="/usr/bin/wkhtmltopdf")
+
+def html_result_for(html_file_path):
+    """Convert the HTML file to PDF once and return the file paths show_html_result serves on later reruns."""
+    pdf_file_path = html_file_path.replace(".html", ".pdf")
+    pdfkit.from_file(html_file_path, pdf_file_path, configuration=get_pdfkit_configuration())
+    return {
+        'html_path': html_file_path,
+        'html_file_name': os.path.basename(html_file_path),
+        'pdf_path': pdf_file_path,
+        'pdf_file_name': os.path.basename(pdf_file_path),
+    }
+
+def show_html_result(result, key_prefix="result"):
+    """Display an HTML result and its download buttons, reading the files only now they are shown."""
+    if not os.path.exists(result['html_path']) or not os.path.exists(result['pdf_path']):
+        st.warning("This output is no longer on disk. Read the video again to recreate it.")
+        return
+
+    with open(result['html_path'], "r", encoding="utf-8") as file:
+        st.components.v1.html(file.read(), height=800, scrolling=True)
+
+    with open(result['html_path'], "rb") as file:
+        st.download_button(
+            label="Download as HTML file",
+            data=file,
+            file_name=result['html_file_name'],
+            mime="text/html",
+            key=f"download_html_{key_prefix}"
+        )
+
+    # Add PDF download button
+    with open(result['pdf_path'], "rb") as file:
+        st.download_button(
+            label="Download as PDF file",
+            data=file,
+            file_name=result['pdf_file_name'],
+            mime="application/pdf",
+            key=f"download_pdf_{key_prefix}"
+        )
+
 def create_and_show_html_main(html_file_path):
     if os.path.exists(html_file_path):
-        with open(html_file_path, "r") as file:
-            html_content = file.read()
-        st.components.v1.html(html_content, height=800, scrolling=True)
-
-        timestamp = int(time.time())
-        download_key = f"download_{html_file_path}_{timestamp}"
-        with open(html_file_path, "rb") as file:
-            st.download_button(
-                label="Download as HTML file",
-                data=file,
-                file_name=os.path.basename(html_file_path),
-                mime="text/html",
-                key=download_key
-            )
-
-        # Configure pdfkit with the wkhtmltopdf executable path inside the devcontainer
-        config = pdfkit.configuration(wkhtmltopdf="/usr/bin/wkhtmltopdf")
-
-        # Add PDF download button
-        pdf_file_path = html_file_path.replace(".html", ".pdf")
-        pdfkit.from_file(html_file_path, pdf_file_path, configuration=config)
-        with open(pdf_file_path, "rb") as file:
-            st.download_button(
-                label="Download as PDF file",
-                data=file,
-                file_name=os.path.basename(pdf_file_path),
-                mime="application/pdf",
-                key=f"download_{pdf_file_path}_{timestamp}"
-            )
+        result = html_result_for(html_file_path)
+        show_html_result(result, key_prefix="new")
+        return result
     else:
         st.error("Failed to create HTML content.")
+        return None
 
-def create_html_file(screenshot_paths, transcript_entries, metadata, organized_transcript, summary, url, output_dir):
+def iter_html_screenshots(segments, url):
+    """Yield the template data for each segment, reading and encoding its screenshot only when the template reaches it."""
+    for screenshot_path, entry in segments:
+        if screenshot_path and os.path.exists(screenshot_path):
+            with open(screenshot_path, "rb") as image_file:
+                encoded_image = base64.b64encode(image_file.read()).decode()
+            mime_type = mimetypes.guess_type(screenshot_path)[0]
+            cleaned_text = entry['text'].replace('\n', ' ')
+            hours, remainder = divmod(entry['start'], 3600)
+            minutes, seconds = divmod(remainder, 60)
+            timestamp_str = f"{int(hours)}h{int(minutes)}m{int(seconds)}s"
+            total_seconds = int(entry['start'])
+            youtube_link_at_time = f"{url}&t={total_seconds}s"
+            yield {
+                'image': encoded_image,
+                'mime': mime_type,
+                'text': cleaned_text,
+                'start': entry['start'],
+                'end': entry['end'],
+                'youtube_link': youtube_link_at_time,
+                'timestamp': timestamp_str
+            }
+
+def create_html_file(segments, metadata, organized_transcript, summary, url, output_dir):
+    """Stream the HTML file to disk so only one encoded screenshot is held in memory at a time.
+
+    segments is any iterable of (screenshot_path, transcript_entry) pairs, such as the output of iter_video_segments.
+    """
     print("Creating HTML content...")
 
     # Load the HTML template
@@ -58,42 +109,18 @@ def create_html_file(screenshot_paths, transcript_entries, metadata, organized_t
     filename = "".join(c if c.isalnum() or c.isspace() else "_" for c in metadata["title"]) + ".html"
     output_path = os.path.join(output_dir, filename)
 
-    # Prepare the data for the template
-    screenshots = []
-    for screenshot_path, entry in zip(screenshot_paths, transcript_entries):
-        if os.path.exists(screenshot_path):
-            with open(screenshot_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode()
-                cleaned_text = entry['text'].replace('\n', ' ')
-                timestamp_seconds = int(entry['start'] * 1000) // 1000
-                hours, remainder = divmod(entry['start'], 3600)
-                minutes, seconds = divmod(remainder, 60)
-                timestamp_str = f"{int(hours)}h{int(minutes)}m{int(seconds)}s"
-                total_seconds = int(entry['start'])
-                youtube_link_at_time = f"{url}&t={total_seconds}s"
-                screenshots.append({
-                    'image': encoded_image,
-                    'text': cleaned_text,
-                    'start': entry['start'],
-                    'end': entry['end'],
-                    'youtube_link': youtube_link_at_time,
-                    'timestamp': timestamp_str
-                })
-
-    # Render the HTML template with the data
-    html_content = template.render(
+    # Render the template piece by piece straight into the file
+    stream = template.stream(
         title=metadata['title'],
         author=metadata['author'],
         description=metadata['description'],
         url=url,
         summary=summary,
         organized_transcript=organized_transcript,
-        screenshots=screenshots
+        screenshots=iter_html_screenshots(segments, url)
     )
-
-    # Write the HTML content to a file
     with open(output_path, "w") as file:
-        file.write(html_content)
+        stream.dump(file)
     print(f"HTML file successfully written to {output_path}")
 
     return output_path
@@ -129,9 +156,107 @@ def open_video_file(video_path):
         st.success("Video file opened successfully")
         return cap
 
-def process_video_segments(cap, transcript, segment_duration, target_width, output_dir, url):
-    screenshot_paths = []
-    combined_transcript_entries = []
+def iter_video_segments(cap, transcript, segment_duration, target_width, output_dir, url, frame_index=None):
+    """Yield a (screenshot_path, transcript_entry) pair per segment. screenshot_path is None if the frame couldn't be read.
+
+    With a frame_index the nearest indexed frame is saved as a JPEG at the index's own width and cap is not touched,
+    so cap can be None. Otherwise the frame is read from cap and saved as a PNG target_width wide.
+    """
+    current_time = 0
+
+    while current_time < transcript[-1]['start'] + transcript[-1]['duration']:
+        segment_end_time = current_time + segment_duration
+
+        relevant_entries = [entry for entry in transcript if current_time <= entry['start'] < segment_end_time]
+
+        if relevant_entries:
+            start_time = relevant_entries[0]['start']
+            end_time = min(relevant_entries[-1]['start'] + relevant_entries[-1]['duration'], segment_end_time)
+            midpoint = (start_time + end_time) / 2
+            midpoint_ms = midpoint * 1000  # Convert to milliseconds
+            midpoint_hms = ms_to_hms(midpoint_ms)  # Convert to hh:mm:ss format
+            timestamp_seconds = int(midpoint_ms // 1000)
+            hours, remainder = divmod(midpoint, 3600)
+            minutes, seconds = divmod(remainder, 60)
+            timestamp_str = f"{int(hours)}h{int(minutes)}m{int(seconds)}s"  
+            total_seconds = int(midpoint)
+
+            youtube_link_at_time = f"{url}&t={total_seconds}s"
+                                                   
+            screenshot_path = None
+            if frame_index is not None:
+                # The index already holds a small JPEG of the frame, so it is written out as it is
+                screenshot_path = os.path.join(output_dir, f'screenshot_{midpoint:.2f}.jpg')
+                with open(screenshot_path, "wb") as image_file:
+                    image_file.write(frame_index.jpeg_at(midpoint))
+            else:
+                cap.set(cv2.CAP_PROP_POS_MSEC, midpoint * 1000)
+                print(f"Set video to {midpoint} milliseconds")
+                ret, frame = cap.read()
+                if ret:
+                    print("Frame read successfully")
+                    height, width, _ = frame.shape
+                    aspect_ratio = float(width) / float(height)
+                    target_height = int(target_width / aspect_ratio)
+                    resized_frame = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_AREA)
+
+                    screenshot_path = os.path.join(output_dir, f'screenshot_{midpoint:.2f}.png')
+                    cv2.imwrite(screenshot_path, resized_frame)
+
+            if screenshot_path:
+                print(f"Screenshot saved at {screenshot_path}")
+
+                # Display the screenshot in the app
+                st.image(screenshot_path)
+                st.markdown(f"Screenshot at {midpoint_hms} - <a href='{youtube_link_at_time}' target='_blank'>Watch on YouTube at this point</a>", unsafe_allow_html=True)
+            else:
+                st.error(f"Failed to read frame at time {current_time}ms in a video of duration {transcript[-1]['start'] + transcript[-1]['duration']}ms")
+
+            # Display the text segment
+            text = " ".join(entry['text'] for entry in relevant_entries)
+            combined_entry = {'start': start_time, 'end': end_time, 'text': text}
+            st.markdown(f"**{segment_duration} second transcript segment:** {text}", unsafe_allow_html=True)
+            yield screenshot_path, combined_entry
+
+        current_time += segment_duration
+
+def ms_to_hms(ms):
+    """Convert milliseconds to hh:mm:ss format."""
+    seconds = int(ms / 1000)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+def check_video_file_exists(video_path):
+    if not os.path.exists(video_path):
+        st.error(f"Video file does not exist at {video_path}")
+        return False
+    else:
+        print("Video file exists")
+        return True
+
+def create_output_directory(output_path):
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+        print(f"Created output directory at {output_path}")
+
+def open_video_file(video_path):
+    print(f"Attempting to open video file at {video_path}")
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"Failed to open video file at {video_path}")
+        st.error(f"Failed to open video file at {video_path}")
+        return None
+    else:
+        st.success("Video file opened successfully")
+        return cap
+
+def iter_video_segments(cap, transcript, segment_duration, target_width, output_dir, url, frame_index=None):
+    """Yield a (screenshot_path, transcript_entry) pair per segment. screenshot_path is None if the frame couldn't be read.
+
+    With a frame_index the nearest indexed frame is saved as a JPEG at the index's own width and cap is not touched,
+    so cap can be None. Otherwise the frame is read from cap and saved as a PNG target_width wide.
+    """
     current_time = 0
 
     while current_time < transcript[-1]['start'] + transcript[-1]['duration']:
@@ -153,20 +278,27 @@ def process_video_segments(cap, transcript, segment_duration, target_width, outp
 
             youtube_link_at_time = f"{url}&t={total_seconds}s"
                                                    
-            cap.set(cv2.CAP_PROP_POS_MSEC, midpoint * 1000)
-            print(f"Set video to {midpoint} milliseconds")
-            ret, frame = cap.read()
-
-            if ret:
-                print("Frame read successfully")
-                height, width, _ = frame.shape
-                aspect_ratio = float(width) / float(height)
-                target_height = int(target_width / aspect_ratio)
-                resized_frame = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_AREA)
-
-                screenshot_path = os.path.join(output_dir, f'screenshot_{midpoint:.2f}.png')
-                cv2.imwrite(screenshot_path, resized_frame)
-                screenshot_paths.append(screenshot_path)
+            screenshot_path = None
+            if frame_index is not None:
+                # The index already holds a small JPEG of the frame, so it is written out as it is
+                screenshot_path = os.path.join(output_dir, f'screenshot_{midpoint:.2f}.jpg')
+                with open(screenshot_path, "wb") as image_file:
+                    image_file.write(frame_index.jpeg_at(midpoint))
+            else:
+                cap.set(cv2.CAP_PROP_POS_MSEC, midpoint * 1000)
+                print(f"Set video to {midpoint} milliseconds")
+                ret, frame = cap.read()
+                if ret:
+                    print("Frame read successfully")
+                    height, width, _ = frame.shape
+                    aspect_ratio = float(width) / float(height)
+                    target_height = int(target_width / aspect_ratio)
+                    resized_frame = cv2.resize(frame, (target_width, target_height), interpolation=cv2.INTER_AREA)
+
+                    screenshot_path = os.path.join(output_dir, f'screenshot_{midpoint:.2f}.png')
+                    cv2.imwrite(screenshot_path, resized_frame)
+
+            if screenshot_path:
                 print(f"Screenshot saved at {screenshot_path}")
 
                 # Display the screenshot in the app
@@ -178,11 +310,18 @@ def process_video_segments(cap, transcript, segment_duration, target_width, outp
             # Display the text segment
             text = " ".join(entry['text'] for entry in relevant_entries)
             combined_entry = {'start': start_time, 'end': end_time, 'text': text}
-            combined_transcript_entries.append(combined_entry)
             st.markdown(f"**{segment_duration} second transcript segment:** {text}", unsafe_allow_html=True)
+            yield screenshot_path, combined_entry
 
         current_time += segment_duration
 
+def process_video_segments(cap, transcript, segment_duration, target_width, output_dir, url):
+    screenshot_paths = []
+    combined_transcript_entries = []
+    for screenshot_path, combined_entry in iter_video_segments(cap, transcript, segment_duration, target_width, output_dir, url):
+        if screenshot_path:
+            screenshot_paths.append(screenshot_path)
+        combined_transcript_entries.append(combined_entry)
     return screenshot_paths, combined_transcript_entries
 
 def ms_to_hms(ms):
@@ -192,27 +331,21 @@ def ms_to_hms(ms):
     minutes, seconds = divmod(remainder, 60)
     return f"{hours:02}:{minutes:02}:{seconds:02}"
 
-def generate_summary(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider):
-    organized_transcript, summary = get_summary(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider)
+def generate_summary(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider, parallel_summary=False, summary_first=True, router=None):
+    if parallel_summary:
+        organized_transcript, summary = get_summary_in_parallel(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider, summary_first=summary_first, router=router)
+    else:
+        organized_transcript, summary = get_summary(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider, router=router)
     print("Transcript and summary generation completed.")
     return organized_transcript, summary
 
-def create_html_file_wrapper(screenshot_paths, combined_transcript_entries, metadata, organized_transcript, summary, url, output_dir):
-    html_file_path = create_html_file(screenshot_paths, combined_transcript_entries, metadata, organized_transcript, summary, url, output_dir)
+def create_html_file_wrapper(segments, metadata, organized_transcript, summary, url, output_dir):
+    html_file_path = create_html_file(segments, metadata, organized_transcript, summary, url, output_dir)
     if html_file_path:
         print(f"HTML file created at: {html_file_path}")
-        create_and_show_html_main(html_file_path)
-    else:
-        print("Failed to create HTML file.")
-    return html_file_path
-
-def delete_video_file(video_path):
-    if os.path.exists(video_path):
-        try:
-            os.remove(video_path)
-            print(f"Deleted video file at {video_path}")
-        except Exception as e:
-            print(f"Error deleting video file: {e}")
+        return create_and_show_html_main(html_file_path)
+    print("Failed to create HTML file.")
+    return None
 
 def delete_screenshot_files(screenshot_paths):
     for screenshot_path in screenshot_paths:
@@ -222,7 +355,7 @@ def delete_screenshot_files(screenshot_paths):
         except Exception as e:
             print(f"Error deleting screenshot file: {e}")
 
-def combine_screenshots_and_transcript(video_path, transcript, metadata, model_choice, url, get_summary, create_and_show_html, api_key, segment_length, generate_transcript, model_provider):   
+def combine_screenshots_and_transcript(video_path, transcript, metadata, model_choice, url, get_summary, create_and_show_html, api_key, segment_length, generate_transcript, model_provider, parallel_summary=False, summary_first=True, router=None):   
 
     if not check_video_file_exists(video_path):
         return
@@ -230,20 +363,37 @@ def combine_screenshots_and_transcript(video_path, transcript, metadata, model_c
     output_dir = "output"
     create_output_directory(output_dir)
 
-    cap = open_video_file(video_path)
-    if cap is None:
-        return
+    # The index is built once per video, after which any screenshot interval is served without decoding it
+    frame_index = load_or_build_frame_index(video_path)
+    if frame_index is not None:
+        video_cache.put(video_path)  # Re-check the disk budget now that the index takes up space too
+        cap = None
+    else:
+        cap = open_video_file(video_path)
+        if cap is None:
+            return
 
-    screenshot_paths, combined_transcript_entries = process_video_segments(cap, transcript, segment_length, 800, output_dir, url)
-    cap.release()
+    # Only paths and text are kept here; the screenshots stay on disk until the HTML is streamed
+    segments = list(iter_video_segments(cap, transcript, segment_length, 800, output_dir, url, frame_index=frame_index))
+    if cap is not None:
+        cap.release()
+    screenshot_paths = [screenshot_path for screenshot_path, _ in segments if screenshot_path]
 
-    transcript_text = " ".join(entry["text"] for entry in combined_transcript_entries)
-    organized_transcript, summary = generate_summary(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider)
+    transcript_text = " ".join(entry["text"] for _, entry in segments)
+    organized_transcript, summary = generate_summary(transcript_text, metadata, model_choice, api_key, generate_transcript, model_provider, parallel_summary=parallel_summary, summary_first=summary_first, router=router)
 
-    html_file_path = create_html_file_wrapper(screenshot_paths, combined_transcript_entries, metadata, organized_transcript, summary, url, output_dir)
+    html_result = create_html_file_wrapper(iter(segments), metadata, organized_transcript, summary, url, output_dir)
+
+    # Keep the result in the library so it can be searched and reused instead of being processed again
+    if html_result:
+        try:
+            # The library's copy outlives the output directory, which the next run clears
+            html_result = save_video(extract_video_id(url), url, metadata, summary, organized_transcript, [entry for _, entry in segments], segment_length, generate_transcript, html_result)
+        except Exception as e:
+            print(f"Error saving video to the library: {e}")
 
-    delete_video_file(video_path)
+    # The video is kept in the download cache so re-runs with other settings skip the download
     delete_screenshot_files(screenshot_paths)
 
-    return html_file_path
+    return html_result
 
@@ -1,8 +1,10 @@
-import os
 import re
 from yt_dlp import YoutubeDL
 import streamlit as st
 import time
+from app.video_cache import video_cache
+
+VIDEO_FORMAT = 'bestvideo[height<=480][ext=mp4]/bestvideo[ext=mp4]/best'
 
 
 def extract_video_id(url):
@@ -26,44 +28,34 @@ def update_progress(d):
         # Update progress bar in Streamlit UI
         st.session_state.progress_bar.progress(progress_float)
 
-def sanitize_filename(title):
-    # Remove or replace characters that are not allowed in filenames
-    title = re.sub(r'[\\/*?:"<>|]', '_', title) # Replacing invalid characters with underscore
-    title = re.sub(r'[^\x00-\x7F]+', '', title) # Removing non-ascii characters
-    return title.strip() # Removing leading/trailing whitespace
-
-# Add the new function to generate video path
-def get_video_path_from_url(url):
-    with YoutubeDL() as ydl:
-        info = ydl.extract_info(url, download=False)
-        sanitized_title = sanitize_filename(info['title'])
-        video_path = os.path.abspath(f"downloads/{sanitized_title}.mp4")
-        return video_path
-
 def download_youtube_video(url):
-    if 'progress_bar' not in st.session_state:
-        st.session_state['progress_bar'] = st.progress(0)
+    video_id = extract_video_id(url)
+    # Another session asking for the same video waits here and then finds it in the cache
+    with video_cache.download_lock(video_id, VIDEO_FORMAT):
+        video_path = video_cache.get(video_id, VIDEO_FORMAT)
+        if video_path:
+            print("Video already downloaded.")
+            return video_path
 
-    with YoutubeDL() as ydl:
-        info = ydl.extract_info(url, download=False)
-        if 'title' in info and isinstance(info['title'], str):
-            sanitized_title = sanitize_filename(info['title'])
-            video_path = os.path.abspath(f"downloads/{sanitized_title}.mp4")
+        if 'progress_bar' not in st.session_state:
+            st.session_state['progress_bar'] = st.progress(0)
 
-            if not os.path.exists(video_path):
+        with YoutubeDL() as ydl:
+            info = ydl.extract_info(url, download=False)
+            if 'title' in info and isinstance(info['title'], str):
+                video_path = video_cache.path_for(video_id, VIDEO_FORMAT)
                 ydl_opts = {
-                    'format': 'bestvideo[height<=480][ext=mp4]/bestvideo[ext=mp4]/best',
+                    'format': VIDEO_FORMAT,
                     'outtmpl': video_path,
                     'progress_hooks': [update_progress],
                     'quiet': True
                 }
                 with YoutubeDL(ydl_opts) as ydl_download:
                     ydl_download.download([url])
+                video_cache.put(video_path)
             else:
-                print("Video already downloaded.")
-        else:
-            print("Error: 'title' not found or not a string in info.")
-            return None
+                print("Error: 'title' not found or not a string in info.")
+                return None
 
     if 'progress_bar' in st.session_state:
         st.session_state.progress_bar.empty()
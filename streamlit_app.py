@@ -1,18 +1,36 @@
 import streamlit as st
 import os
 import streamlit.components.v1 as components
-from app.youtube_downloader import download_youtube_video, get_video_metadata, extract_video_id
+from app.youtube_downloader import download_youtube_video, get_video_metadata, extract_video_id, VIDEO_FORMAT
+from app.video_cache import video_cache
 from app.transcript_processor import get_transcript
-from app.video_processor import combine_screenshots_and_transcript, create_and_show_html_main, clear_output_directory
+from app.video_processor import combine_screenshots_and_transcript, create_and_show_html_main, clear_output_directory, show_html_result, ms_to_hms
 from app.summariser import get_summary, summarize_web_page
+from app.library import get_stored_result, search
+from app.router import Route, Router
 import time
 
 st.set_page_config(page_title="ReadTube", page_icon="📚", layout="centered")
 
-html_file_path_global = ""
+MODEL_CHOICES = {
+    "openai": "gpt-4o",
+    "anthropic": "claude-3-opus-20240229",
+}
+
+SAMPLE_HTML_PATH = "samples/How to tune LLMs in Generative AI Studio.html"
+
+@st.cache_data
+def load_sample_html():
+    # Read once per server process and shared by every session
+    with open(SAMPLE_HTML_PATH, 'r', encoding='utf-8') as file:
+        return file.read()
+
+@st.cache_data
+def search_library(query):
+    # Cached so reruns with the same query don't hit the database; cleared whenever a video is saved
+    return search(query)
 
 def main():
-    global html_file_path_global
     st.title('📚 ReadTube')
     st.markdown("<h2>Read YouTube instead of watching it!</h2>", unsafe_allow_html=True)
 
@@ -75,6 +93,26 @@ def main():
         anthropic_api_key = st.text_input("[Get your key from Anthropic Website](https://console.anthropic.com/settings/keys) : ", placeholder="sk-****************************************", type="password")
         openai_api_key = ""
 
+    with st.expander("⚖️ Spread requests across OpenAI and Anthropic", expanded=False):
+        use_router = st.toggle(
+            "Use both providers",
+            key='use_router',
+            help="Each transcript chunk is sent to whichever provider is answering fastest. If a request is slow to start, the same request is also sent to the other provider and the first to answer is used."
+        )
+        if use_router:
+            if model_provider == "openai":
+                anthropic_api_key = st.text_input("Your Anthropic API key", placeholder="sk-****************************************", type="password", key='router_anthropic_api_key')
+            else:
+                openai_api_key = st.text_input("Your OpenAI API key", placeholder="sk-****************************************", type="password", key='router_openai_api_key')
+            routing_strategy_options = {"Fastest first": "least_latency", "Weighted": "weighted"}
+            selected_routing_strategy = st.radio("Routing", list(routing_strategy_options.keys()), horizontal=True, key='routing_strategy')
+            routing_strategy = routing_strategy_options[selected_routing_strategy]
+            if 'router' in st.session_state:
+                st.markdown("Time to first token per provider in this session (seconds):")
+                st.table(st.session_state['router'].stats())
+        else:
+            routing_strategy = None
+
     col1, col2 = st.columns(2)
 
     with col1:
@@ -109,6 +147,22 @@ def main():
             index=0,
             help="If you select 'Yes', the full transcript will be combined into a single readable document, split into paragraphs with sub-headings. This is in addition to the transcript chunks next to each screenshot. For longer videos, this process takes more time and costs about half a dollar per hour of video."
         )
+
+    st.markdown("#### 📝 When should the summary be written?")
+    summary_timing_options = {
+        "After the organised transcript": (False, True),
+        "Straight away, shown first": (True, True),
+        "Straight away, shown after the transcript": (True, False),
+    }
+    selected_summary_timing = st.radio(
+        "Summary timing",
+        list(summary_timing_options.keys()),
+        horizontal=True,
+        index=0,
+        label_visibility='collapsed',
+        help="'Straight away' writes the summary from the raw transcript at the same time as the transcript is organised, so it appears within seconds instead of after the whole transcript."
+    )
+    parallel_summary, summary_first = summary_timing_options[selected_summary_timing]
     
     st.markdown("#### 🔗 YouTube video URL")
     if model_provider == "openai":
@@ -163,7 +217,7 @@ def main():
             elif model_provider == "anthropic" and not anthropic_api_key:
                 st.error("Please enter an Anthropic API key to use the Anthropic model.")
             else:
-                process_video(url, openai_api_key, anthropic_api_key, segment_length, model_provider, generate_transcript)
+                process_video(url, openai_api_key, anthropic_api_key, segment_length, model_provider, generate_transcript, parallel_summary, summary_first, routing_strategy)
         else:
             if not anthropic_api_key:
                 st.error("This looks like a web page. I can summarise the content. To do that please enter an Anthropic API key and I will use Claude 3 Haiku to do that quickly.")
@@ -172,6 +226,18 @@ def main():
 
     st.divider()  # Add a horizontal line with some default margin
 
+    with st.expander("🔎 Search videos already read", expanded=False):
+        query = st.text_input("Search the library", key='library_query', placeholder="Search titles, summaries and transcripts", label_visibility='collapsed')
+        if query:
+            results = search_library(query)
+            if not results:
+                st.info("No matching videos in the library.")
+            for result in results:
+                if result['start'] is not None:
+                    st.markdown(f"**{result['title']}** - [Watch at {ms_to_hms(result['start'] * 1000)}]({result['youtube_link']})  \n{result['snippet']}")
+                else:
+                    st.markdown(f"**{result['title']}** ({result['kind']}) - [Watch on YouTube]({result['youtube_link']})  \n{result['snippet']}")
+
 
     with st.expander("🔗 Example YouTube Videos", expanded=True):
         st.markdown("""
@@ -214,23 +280,46 @@ def main():
         st.markdown("""
         <h3>Here's an example of what ReadTube can generate:</h3>
         """, unsafe_allow_html=True)
-        html_string = open("samples/How to tune LLMs in Generative AI Studio.html", 'r', encoding='utf-8').read()
-        st.components.v1.html(html_string, height=600, scrolling=True)
-
-    if html_file_path_global:
-        create_and_show_html_main(html_file_path_global)
-
-def process_video(url, openai_api_key, anthropic_api_key, segment_length, model_provider, generate_transcript):
+        # Only send the 1.5 MB sample to the browser when asked for, not on every rerun
+        if st.toggle("Show the example", key='show_sample'):
+            st.components.v1.html(load_sample_html(), height=600, scrolling=True)
+
+    if 'html_result' in st.session_state:
+        with st.expander("📄 Your ReadTube output", expanded=True):
+            # The output inlines every screenshot, so it is only sent to the browser again when asked for
+            if st.toggle("Show the output", key='show_result'):
+                show_html_result(st.session_state['html_result'], key_prefix="saved")
+
+def get_router(openai_api_key, anthropic_api_key, routing_strategy):
+    """Return this session's router, keeping its latency statistics while the keys and strategy stay the same.
+
+    Returns None unless both keys were entered, since with one route there is nothing to spread requests across.
+    """
+    routes = []
+    if openai_api_key:
+        routes.append(Route("OpenAI", "openai", MODEL_CHOICES["openai"], openai_api_key))
+    if anthropic_api_key:
+        routes.append(Route("Anthropic", "anthropic", MODEL_CHOICES["anthropic"], anthropic_api_key))
+    if len(routes) < 2:
+        return None
+    config = (openai_api_key, anthropic_api_key, routing_strategy)
+    if st.session_state.get('router_config') != config:
+        st.session_state['router'] = Router(routes, strategy=routing_strategy)
+        st.session_state['router_config'] = config
+    return st.session_state['router']
+
+def process_video(url, openai_api_key, anthropic_api_key, segment_length, model_provider, generate_transcript, parallel_summary=False, summary_first=True, routing_strategy=None):
     if model_provider == "openai":
-        model_choice = "gpt-4o"
         api_key = openai_api_key
     elif model_provider == "anthropic":
-        model_choice = "claude-3-opus-20240229"
         api_key = anthropic_api_key
     else:
         raise ValueError(f"Unsupported model provider: {model_provider}")
+    model_choice = MODEL_CHOICES[model_provider]
+    router = get_router(openai_api_key, anthropic_api_key, routing_strategy) if routing_strategy else None
+    if routing_strategy and router is None:
+        st.warning("Requests are only spread across providers when both API keys are entered, so only the selected provider is used.")
 
-    global html_file_path_global
     generate_transcript = generate_transcript == "Yes"
 
     if not url:
@@ -240,26 +329,40 @@ def process_video(url, openai_api_key, anthropic_api_key, segment_length, model_
     clear_output_directory('output')
 
     try:
-        st.info("Downloading the video...")
-        video_path = download_youtube_video(url)
-        print(f"Downloaded video path: {video_path}")
-
-        st.info("Fetching video metadata...")
-        metadata = get_video_metadata(url)
-
-        st.info("Fetching transcript...")
         video_id = extract_video_id(url)
-        transcript = get_transcript(video_id)
-        if transcript:
-            st.success("Transcript successfully fetched.")
-
-            st.info("Processing the video and generating summary...")
-            html_file_path = combine_screenshots_and_transcript(video_path, transcript, metadata, model_choice, url, get_summary, create_and_show_html_main, api_key, segment_length, generate_transcript, model_provider)
-            if html_file_path:
-                html_file_path_global = html_file_path
-                st.success("Summary and screenshots are ready.")
-        else:
-            st.error("Failed to fetch transcript.")
+        stored_result = get_stored_result(video_id, segment_length, generate_transcript)
+        if stored_result:
+            st.success("This video has already been read with these settings, so the saved result is shown.")
+            st.session_state['html_result'] = stored_result
+            show_html_result(stored_result, key_prefix="new")
+            return
+
+        # Hold the cached video for the whole run so another session can't evict it mid-read
+        with video_cache.in_use(video_id, VIDEO_FORMAT):
+            st.info("Downloading the video...")
+            video_path = download_youtube_video(url)
+            print(f"Downloaded video path: {video_path}")
+
+            st.info("Fetching video metadata...")
+            metadata = get_video_metadata(url)
+
+            st.info("Fetching transcript...")
+            transcript = get_transcript(video_id)
+            if transcript:
+                st.success("Transcript successfully fetched.")
+
+                st.info("Processing the video and generating summary...")
+                html_result = combine_screenshots_and_transcript(video_path, transcript, metadata, model_choice, url, get_summary, create_and_show_html_main, api_key, segment_length, generate_transcript, model_provider, parallel_summary=parallel_summary, summary_first=summary_first, router=router)
+                if html_result:
+                    html_result['metadata'] = metadata
+                    # Only the file paths are kept for the session; the files are read when the output is shown
+                    st.session_state['html_result'] = html_result
+                    search_library.clear()
+                    st.success("Summary and screenshots are ready.")
+            else:
+                st.error("Failed to fetch transcript.")
+        stats = video_cache.stats()
+        print(f"Video cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size_bytes'] / 1024 ** 2:.1f} MB of {stats['budget_bytes'] / 1024 ** 2:.0f} MB used")
     except Exception as e:
         st.error(f"Error processing video: {e}")
 
@@ -276,4 +379,4 @@ def process_webpage(url, anthropic_api_key):
         st.error(f"Error summarising content: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
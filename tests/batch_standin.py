@@ -0,0 +1,157 @@
+"""A local stand-in for the OpenAI and Anthropic batch APIs, for running the batch code without real keys.
+
+Point the SDKs at it with OPENAI_BASE_URL=<url>/v1 and ANTHROPIC_BASE_URL=<url>. Each request is answered with
+"[organised <last message text>]", and a batch reports itself finished on its polls_until_done-th status poll.
+"""
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def answer(messages):
+    content = messages[-1]['content']
+    text = content if isinstance(content, str) else content[-1]['text']
+    # OpenAI requests carry the organise instructions and the chunk in one text, separated by " : "
+    return f"[organised {text.split(' : ')[-1]}]"
+
+
+def jsonl_from_upload(body):
+    """Return the lines of the file in a multipart upload to /v1/files."""
+    start = body.index(b'\r\n\r\n', body.index(b'filename=')) + 4
+    return body[start:body.rindex(b'\r\n--')].decode().splitlines()
+
+
+class BatchStandin:
+    def __init__(self, polls_until_done=2, fail_submits=0, failed_custom_ids=()):
+        self.polls_until_done = polls_until_done
+        self.fail_submits = fail_submits  # Answer this many batch submissions with a 500 error
+        self.failed_custom_ids = set(failed_custom_ids)  # Requests that finish with an error instead of a response
+        self.submits = 0
+        self.batches = {}
+        self.files = {}
+        self.polls = {}
+        self._ids = itertools.count()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def _done(self, batch_id):
+        return self.polls[batch_id] >= self.polls_until_done
+
+    def anthropic_batch(self, batch_id):
+        done = self._done(batch_id)
+        return {
+            "id": batch_id, "type": "message_batch", "processing_status": "ended" if done else "in_progress",
+            "request_counts": {"processing": 0, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": "2024-01-01T00:00:00Z", "expires_at": "2024-01-02T00:00:00Z",
+            "ended_at": None, "cancel_initiated_at": None, "archived_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if done else None,
+        }
+
+    def openai_batch(self, batch_id):
+        done = self._done(batch_id)
+        return {
+            "id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "input_file_id": "file",
+            "completion_window": "24h", "status": "completed" if done else "in_progress", "created_at": 0,
+            "output_file_id": self.batches[batch_id] if done else None,
+        }
+
+    def submit_anthropic(self, body):
+        requests = json.loads(body)['requests']
+        batch_id = self._new_id("msgbatch")
+        # Results come back in a different order from the requests, as they can with the real API
+        self.batches[batch_id] = [
+            {"custom_id": request['custom_id'], "result": {"type": "succeeded", "message": {
+                "id": "msg", "type": "message", "role": "assistant", "model": request['params']['model'],
+                "content": [{"type": "text", "text": answer(request['params']['messages'])}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": {"input_tokens": 1, "output_tokens": 1},
+            }}}
+            if request['custom_id'] not in self.failed_custom_ids else
+            {"custom_id": request['custom_id'], "result": {"type": "errored", "error": {
+                "type": "error", "error": {"type": "api_error", "message": "Internal server error"},
+            }}}
+            for request in reversed(requests)
+        ]
+        self.polls[batch_id] = 0
+        return self.anthropic_batch(batch_id)
+
+    def submit_openai(self, body):
+        lines = jsonl_from_upload(self.files[json.loads(body)['input_file_id']])
+        output = []
+        for line in reversed(lines):
+            request = json.loads(line)
+            if request['custom_id'] in self.failed_custom_ids:
+                output.append(json.dumps({"id": "response", "custom_id": request['custom_id'], "response": {
+                    "status_code": 500, "body": {"error": {"message": "Internal server error"}},
+                }}))
+                continue
+            output.append(json.dumps({"id": "response", "custom_id": request['custom_id'], "response": {
+                "status_code": 200, "body": {"choices": [{"message": {"content": answer(request['body']['messages'])}}]},
+            }}))
+        output_file_id = self._new_id("file")
+        self.files[output_file_id] = "\n".join(output).encode()
+        batch_id = self._new_id("batch")
+        self.batches[batch_id] = output_file_id
+        self.polls[batch_id] = 0
+        return self.openai_batch(batch_id)
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, body, status=200, content_type="application/json"):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                path = self.path.split('?')[0]
+                if path == '/v1/files':
+                    file_id = standin._new_id("file")
+                    standin.files[file_id] = body
+                    return self.send({"id": file_id, "object": "file", "bytes": len(body), "created_at": 0, "filename": "requests.jsonl", "purpose": "batch", "status": "processed"})
+                if path in ('/v1/messages/batches', '/v1/batches'):
+                    standin.submits += 1
+                    if standin.submits <= standin.fail_submits:
+                        return self.send({"error": {"type": "api_error", "message": "Internal server error"}}, status=500)
+                    if path == '/v1/messages/batches':
+                        return self.send(standin.submit_anthropic(body))
+                    return self.send(standin.submit_openai(body))
+                self.send({"error": path}, status=404)
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                parts = path.strip('/').split('/')
+                if path.startswith('/v1/messages/batches/') and path.endswith('/results'):
+                    results = "\n".join(json.dumps(result) for result in standin.batches[parts[3]])
+                    return self.send(results.encode(), content_type="application/binary")
+                if path.startswith('/v1/messages/batches/'):
+                    standin.polls[parts[3]] += 1
+                    return self.send(standin.anthropic_batch(parts[3]))
+                if path.startswith('/v1/batches/'):
+                    standin.polls[parts[2]] += 1
+                    return self.send(standin.openai_batch(parts[2]))
+                if path.startswith('/v1/files/') and path.endswith('/content'):
+                    return self.send(standin.files[parts[2]], content_type="application/octet-stream")
+                self.send({"error": path}, status=404)
+
+        return Handler
@@ -0,0 +1,78 @@
+"""Local fake OpenAI-compatible chat providers that stream at a chosen speed, for exercising the router.
+
+Give a Route base_url=provider.url. Each request waits first_token_delay seconds, then streams pieces of text
+named after the provider with piece_delay seconds between them, or answers with status if it isn't 200. With
+failures set, only that many requests get the error status and the rest succeed.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeProvider:
+    def __init__(self, name, first_token_delay=0.0, piece_delay=0.01, pieces=3, status=200, failures=None):
+        self.name = name
+        self.first_token_delay = first_token_delay
+        self.piece_delay = piece_delay
+        self.pieces = pieces
+        self.status = status
+        self.failures = failures
+        self.requests = 0
+        self.completed = 0
+        self.disconnected = threading.Event()  # Set when a client closes a stream before the end
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def text(self):
+        """The whole text one successful request streams."""
+        return "".join(f"{self.name}{i} " for i in range(self.pieces))
+
+    def _handler(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                provider.requests += 1
+                time.sleep(provider.first_token_delay)
+                if provider.status != 200 and (provider.failures is None or provider.requests <= provider.failures):
+                    body = json.dumps({"error": {"message": f"{provider.name} is down", "type": "server_error"}}).encode()
+                    self.send_response(provider.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                try:
+                    for i in range(provider.pieces):
+                        chunk = {"id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "model",
+                                 "choices": [{"index": 0, "delta": {"content": f"{provider.name}{i} "}, "finish_reason": None}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                        time.sleep(provider.piece_delay)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                    provider.completed += 1
+                except (BrokenPipeError, ConnectionResetError):
+                    provider.disconnected.set()
+
+        return Handler
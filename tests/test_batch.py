@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from app import batch_organise, summariser
+from tests.batch_standin import BatchStandin
+
+PROVIDERS = ["openai", "anthropic"]
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    with BatchStandin() as standin:
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{standin.url}/v1")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", standin.url)
+        yield standin
+
+
+@pytest.mark.parametrize("model_provider", PROVIDERS)
+def test_run_batch_waits_for_the_results(standin, model_provider):
+    requests_by_id = {f"chunk-{i}": summariser.organise_messages(text, model_provider) for i, text in enumerate(["one", "two", "three"])}
+
+    results = summariser.run_batch(requests_by_id, "model", "sk-test", model_provider, poll_seconds=0.01)
+
+    assert results == {"chunk-0": "[organised one]", "chunk-1": "[organised two]", "chunk-2": "[organised three]"}
+    # It kept polling until the batch reported itself finished
+    [polls] = standin.polls.values()
+    assert polls >= standin.polls_until_done
+
+
+@pytest.mark.parametrize("model_provider", PROVIDERS)
+def test_organise_transcript_batch_keeps_chunk_order(standin, model_provider):
+    organised = summariser.organise_transcript_batch(["one", "two", "three"], "model", "sk-test", model_provider, poll_seconds=0.01)
+
+    assert organised == "[organised one][organised two][organised three]"
+
+
+@pytest.mark.parametrize("model_provider", PROVIDERS)
+def test_failed_submit_is_not_retried(model_provider, monkeypatch):
+    with BatchStandin(fail_submits=1) as standin:
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{standin.url}/v1")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", standin.url)
+        with pytest.raises(Exception):
+            summariser.submit_batch({"chunk-0": summariser.organise_messages("one", model_provider)}, "model", "sk-test", model_provider)
+    assert standin.submits == 1
+
+
+def test_submit_records_the_batch_and_collect_writes_each_video(standin, tmp_path, monkeypatch):
+    transcripts = {
+        "first": [{"text": "one"}, {"text": "two"}],
+        "second": [{"text": "three"}],
+    }
+    monkeypatch.setattr(batch_organise, "get_transcript", lambda video_id: transcripts.get(video_id))
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-test")
+    batches_dir = str(tmp_path / "batches")
+    output_dir = str(tmp_path / "output")
+
+    record = batch_organise.submit(
+        ["https://www.youtube.com/watch?v=first", "https://youtu.be/second", "https://youtu.be/missing"],
+        "anthropic", "model", "sk-test", batches_dir,
+    )
+    with open(batch_organise.record_path(record['batch_id'], batches_dir)) as file:
+        assert json.load(file)['videos'] == {
+            "first": {"url": "https://www.youtube.com/watch?v=first", "custom_ids": ["first-chunk-0"]},
+            "second": {"url": "https://youtu.be/second", "custom_ids": ["second-chunk-0"]},
+        }
+
+    # The first poll finds the batch still running, so nothing is written and it stays pending
+    assert batch_organise.collect(batches_dir=batches_dir, output_dir=output_dir) == []
+    paths = batch_organise.collect(batches_dir=batches_dir, output_dir=output_dir)
+
+    assert sorted(paths) == [str(tmp_path / "output" / "first-organised.txt"), str(tmp_path / "output" / "second-organised.txt")]
+    with open(paths[0]) as file:
+        assert file.read() in ("[organised one two]", "[organised three]")
+    assert batch_organise.read_records(batches_dir=batches_dir) == []
+
+
+@pytest.mark.parametrize("model_provider", PROVIDERS)
+def test_collect_records_the_chunks_that_failed(model_provider, tmp_path, monkeypatch, capsys):
+    transcripts = {"first": [{"text": "one"}], "second": [{"text": "two"}]}
+    monkeypatch.setattr(batch_organise, "get_transcript", lambda video_id: transcripts.get(video_id))
+    monkeypatch.setenv(batch_organise.API_KEY_VARIABLES[model_provider], "sk-test")
+    batches_dir = str(tmp_path / "batches")
+    output_dir = str(tmp_path / "output")
+
+    with BatchStandin(polls_until_done=0, failed_custom_ids={"second-chunk-0"}) as standin:
+        monkeypatch.setenv("OPENAI_BASE_URL", f"{standin.url}/v1")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", standin.url)
+        record = batch_organise.submit(["https://youtu.be/first", "https://youtu.be/second"], model_provider, "model", "sk-test", batches_dir)
+        paths = batch_organise.collect(batches_dir=batches_dir, output_dir=output_dir)
+
+    assert paths == [str(tmp_path / "output" / "first-organised.txt")]
+    with open(batch_organise.record_path(record['batch_id'], batches_dir)) as file:
+        assert json.load(file)['failed'] == {"second": ["second-chunk-0"]}
+    assert "python -m app.batch_organise submit https://youtu.be/second" in capsys.readouterr().out
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import frame_index
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "video.mp4")
+    frame_index.write_synthetic_video(path, 10, size=(320, 180))
+    return path
+
+
+def test_build_stores_a_jpeg_every_step(tmp_path, video_path):
+    path = str(tmp_path / "video.mp4")
+    os.link(video_path, path)
+
+    index = frame_index.build_frame_index(path, workers=1)
+
+    assert len(index) == 5
+    assert index.jpeg_at(4.2)[:2] == b"\xff\xd8"
+    assert index.nearest(4.2) == 2
+    assert sorted(os.listdir(tmp_path)) == ["video.mp4", "video.mp4.frames", "video.mp4.frames.npy"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_build_returns_none_and_leaves_no_files(tmp_path, video_path, workers):
+    path = str(tmp_path / "video.mp4")
+    os.link(video_path, path)
+
+    # A negative width makes cv2.resize raise inside every shard, in a worker process when workers > 1
+    assert frame_index.build_frame_index(path, frame_width=-1, workers=workers) is None
+    assert os.listdir(tmp_path) == ["video.mp4"]
+
+
+def test_concurrent_loads_build_the_index_once(tmp_path, video_path, monkeypatch):
+    path = str(tmp_path / "video.mp4")
+    os.link(video_path, path)
+    builds = []
+    build_frame_index = frame_index.build_frame_index
+
+    def counting_build(video_path):
+        builds.append(video_path)
+        return build_frame_index(video_path, workers=1)
+
+    monkeypatch.setattr(frame_index, "build_frame_index", counting_build)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        indexes = list(executor.map(frame_index.load_or_build_frame_index, [path] * 3))
+
+    assert builds == [path]
+    assert all(index is not None and len(index) == 5 for index in indexes)
+    assert sorted(os.listdir(tmp_path)) == ["video.mp4", "video.mp4.frames", "video.mp4.frames.npy"]
+
+
+def test_concurrent_builds_use_their_own_temporary_files(tmp_path, video_path):
+    path = str(tmp_path / "video.mp4")
+    os.link(video_path, path)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        indexes = list(executor.map(lambda _: frame_index.build_frame_index(path, workers=1), range(3)))
+
+    assert all(index is not None and len(index) == 5 for index in indexes)
+    assert sorted(os.listdir(tmp_path)) == ["video.mp4", "video.mp4.frames", "video.mp4.frames.npy"]
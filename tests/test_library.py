@@ -0,0 +1,126 @@
+import pytest
+
+from app import library
+
+METADATA = {'title': "Tuning language models", 'author': "Google Cloud", 'description': "How to tune a model"}
+SEGMENTS = [
+    {'start': 0.0, 'end': 30.0, 'text': "Welcome to this video about tuning"},
+    {'start': 30.0, 'end': 60.0, 'text': "Parameter efficient tuning adapts a small number of weights"},
+    {'start': 95.5, 'end': 120.0, 'text': "Next, create a tuning job in the console"},
+]
+URL = "https://www.youtube.com/watch?v=abc123"
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "library" / "readtube.db")
+
+
+@pytest.fixture
+def html_result(tmp_path):
+    html_path = tmp_path / "output" / "Tuning.html"
+    html_path.parent.mkdir()
+    html_path.write_text("<html>Tuning</html>", encoding="utf-8")
+    pdf_path = tmp_path / "output" / "Tuning.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4")
+    return {'html_path': str(html_path), 'html_file_name': "Tuning.html", 'pdf_path': str(pdf_path), 'pdf_file_name': "Tuning.pdf"}
+
+
+def save(db_path, html_result, segment_length=30, generate_transcript=True, summary="A video about tuning models."):
+    return library.save_video("abc123", URL, METADATA, summary, "Organised transcript about checkpoints", SEGMENTS, segment_length, generate_transcript, html_result, db_path=db_path)
+
+
+def test_saved_result_is_a_copy_in_the_library(db_path, html_result, tmp_path):
+    stored = save(db_path, html_result)
+
+    assert stored['html_path'] != html_result['html_path']
+    assert stored['html_path'].startswith(str(tmp_path / "library" / "results"))
+    (tmp_path / "output" / "Tuning.html").unlink()
+    (tmp_path / "output" / "Tuning.pdf").unlink()
+
+    result = library.get_stored_result("abc123", 30, True, db_path=db_path)
+    assert result['html_path'] == stored['html_path']
+    assert result['pdf_path'] == stored['pdf_path']
+    assert result['html_file_name'] == "Tuning.html"
+    assert result['metadata'] == METADATA
+    with open(result['html_path'], encoding="utf-8") as file:
+        assert file.read() == "<html>Tuning</html>"
+
+
+def test_result_is_only_reused_with_the_same_settings(db_path, html_result):
+    save(db_path, html_result, segment_length=30, generate_transcript=True)
+
+    assert library.get_stored_result("abc123", 30, True, db_path=db_path) is not None
+    assert library.get_stored_result("abc123", 60, True, db_path=db_path) is None
+    assert library.get_stored_result("abc123", 30, False, db_path=db_path) is None
+    assert library.get_stored_result("other", 30, True, db_path=db_path) is None
+
+
+def test_other_settings_keep_their_own_result(db_path, html_result):
+    first = save(db_path, html_result, segment_length=30)
+    second = save(db_path, html_result, segment_length=60)
+
+    assert first['html_path'] != second['html_path']
+    assert library.get_stored_result("abc123", 30, True, db_path=db_path)['html_path'] == first['html_path']
+    assert library.get_stored_result("abc123", 60, True, db_path=db_path)['html_path'] == second['html_path']
+
+
+def test_result_with_removed_files_is_not_reused(db_path, html_result):
+    stored = save(db_path, html_result)
+    library.os.remove(stored['pdf_path'])
+
+    assert library.get_stored_result("abc123", 30, True, db_path=db_path) is None
+
+
+def test_missing_library_has_no_results(db_path):
+    assert library.get_stored_result("abc123", 30, True, db_path=db_path) is None
+    assert library.search("tuning", db_path=db_path) == []
+
+
+def test_search_links_segments_to_their_moment(db_path, html_result):
+    save(db_path, html_result)
+
+    [result] = library.search("console", db_path=db_path)
+    assert result['kind'] == 'segment'
+    assert result['start'] == 95.5
+    assert result['youtube_link'] == f"{URL}&t=95s"
+    assert result['snippet'] == "Next, create a tuning job in the **console**"
+
+
+def test_search_finds_summaries_and_transcripts_without_a_moment(db_path, html_result):
+    save(db_path, html_result)
+
+    kinds = {result['kind']: result for result in library.search("checkpoints", db_path=db_path)}
+    assert set(kinds) == {'transcript'}
+    assert kinds['transcript']['youtube_link'] == URL
+
+    # Stemming matches "models" in the summary to the query "model"
+    assert {result['kind'] for result in library.search("model", db_path=db_path)} >= {'summary', 'description'}
+
+
+def test_transcript_is_only_searchable_when_it_was_generated(db_path, html_result):
+    save(db_path, html_result, generate_transcript=False)
+
+    assert library.search("checkpoints", db_path=db_path) == []
+
+
+@pytest.mark.parametrize("query", ['tuning"', '"tuning', "-tuning", "tuning*", "(tuning)", "tuning:", "tuning AND", "NEAR(tuning"])
+def test_search_treats_query_syntax_as_plain_words(db_path, html_result, query):
+    save(db_path, html_result)
+
+    results = library.search(query, db_path=db_path)
+
+    # Operators are searched for as words, so a query with "AND" or "NEAR" only matches text containing them
+    if "AND" in query or "NEAR" in query:
+        assert results == []
+    else:
+        assert results
+
+
+def test_saving_again_replaces_the_searchable_text(db_path, html_result):
+    save(db_path, html_result, summary="A video about quantisation.")
+    save(db_path, html_result, summary="Now about distillation.")
+
+    assert [result['kind'] for result in library.search("distillation", db_path=db_path)] == ['summary']
+    assert library.search("quantisation", db_path=db_path) == []
+    assert len(library.search("console", db_path=db_path)) == 1
@@ -0,0 +1,108 @@
+import time
+
+from app.router import Route, Router
+from tests.fake_providers import FakeProvider
+
+
+def messages(model_provider):
+    return [{"role": "user", "content": "Organise this transcript"}]
+
+
+def route(provider):
+    return Route(provider.name, "openai", "model", "sk-test", base_url=provider.url)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_least_latency_prefers_the_faster_provider():
+    with FakeProvider("fast", first_token_delay=0.01) as fast, FakeProvider("slow", first_token_delay=0.3) as slow:
+        router = Router([route(slow), route(fast)], strategy="least_latency")
+
+        # Each route is tried once before there are samples to compare
+        texts = ["".join(router.stream(messages)) for _ in range(5)]
+
+    assert sorted(texts[:2]) == sorted([fast.text(), slow.text()])
+    assert texts[2:] == [fast.text()] * 3
+
+
+def test_slow_start_is_hedged_on_the_other_provider():
+    with FakeProvider("fast", first_token_delay=0.01) as fast, FakeProvider("slow", first_token_delay=0.2) as slow:
+        router = Router([route(fast), route(slow)], strategy="least_latency", min_hedge_samples=3)
+        for _ in range(5):
+            "".join(router.stream(messages))
+        # Jitter in the warm-up can already trigger a hedge now and then, so only the next request is counted
+        before = router.stats()["slow"]
+
+        # The fast provider now takes far longer than its usual time to first token
+        fast.first_token_delay = 3
+        started = time.time()
+        text = "".join(router.stream(messages))
+        elapsed = time.time() - started
+
+    assert text == slow.text()
+    assert elapsed < 1.5
+    assert router.stats()["slow"]["hedges_started"] == before["hedges_started"] + 1
+    assert router.stats()["slow"]["hedges_won"] == before["hedges_won"] + 1
+
+
+def test_failing_provider_fails_over_without_retrying():
+    with FakeProvider("broken", status=500) as broken, FakeProvider("healthy") as healthy:
+        router = Router([route(broken), route(healthy)], strategy="least_latency")
+        started = time.time()
+        text = "".join(router.stream(messages))
+        elapsed = time.time() - started
+
+    assert text == healthy.text()
+    # A retried request would wait at least a second before trying again
+    assert elapsed < 1
+    assert broken.requests == 1
+    assert router.stats()["broken"]["errors"] == 1
+
+
+def test_failing_provider_is_skipped_on_later_requests():
+    with FakeProvider("broken", status=500) as broken, FakeProvider("healthy") as healthy:
+        router = Router([route(broken), route(healthy)], strategy="least_latency")
+        texts = ["".join(router.stream(messages)) for _ in range(5)]
+
+    assert texts == [healthy.text()] * 5
+    # Only the first request found out the route was broken; the rest went straight to the healthy one
+    assert broken.requests == 1
+    assert router.stats()["broken"]["consecutive_errors"] == 1
+
+
+def test_failing_route_is_tried_again_after_its_backoff(monkeypatch):
+    with FakeProvider("flaky", status=500, failures=1) as flaky, FakeProvider("slow", first_token_delay=0.2) as slow:
+        router = Router([route(flaky), route(slow)], strategy="least_latency")
+        assert "".join(router.stream(messages)) == slow.text()
+
+        monkeypatch.setattr(router.routes[0], "backoff_until", 0)
+        assert "".join(router.stream(messages)) == flaky.text()
+    assert router.stats()["flaky"]["consecutive_errors"] == 0
+
+
+def test_lone_route_retries_instead_of_failing():
+    with FakeProvider("limited", status=429, failures=1) as provider:
+        router = Router([route(provider)])
+        text = "".join(router.stream(messages))
+
+    assert text == provider.text()
+    assert provider.requests == 2
+
+
+def test_closing_the_stream_cancels_the_winning_attempt():
+    with FakeProvider("long", pieces=500, piece_delay=0.01) as provider:
+        router = Router([route(provider)])
+        pieces = router.stream(messages)
+        assert next(pieces) == "long0 "
+        pieces.close()
+
+        assert provider.disconnected.wait(timeout=5)
+        assert wait_for(lambda: router.stats()["long"]["cancelled"] == 1)
+    assert provider.completed == 0
@@ -0,0 +1,102 @@
+import builtins
+import os
+import sqlite3
+import subprocess
+import sys
+from contextlib import ExitStack
+from unittest import mock
+
+import cv2
+import numpy as np
+import pytest
+from streamlit.testing.v1 import AppTest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "streamlit_app.py")
+
+
+@pytest.fixture
+def app_test(monkeypatch):
+    # The app reads the sample and writes output relative to the repository root
+    monkeypatch.chdir(REPO_ROOT)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    assert not at.exception
+    return at
+
+
+class IOCounter:
+    """Patch file, database, video and subprocess entry points and record calls made from the app's own code."""
+
+    def __init__(self):
+        self.calls = []
+
+    def _from_app(self):
+        caller = sys._getframe(2).f_code.co_filename
+        return caller.startswith(REPO_ROOT) and os.sep + "tests" + os.sep not in caller
+
+    def _wrap(self, name, original):
+        def wrapper(*args, **kwargs):
+            if self._from_app():
+                self.calls.append((name, args[:1]))
+            return original(*args, **kwargs)
+        return wrapper
+
+    def _wrap_popen_init(self, original):
+        def wrapper(popen, *args, **kwargs):
+            self.calls.append(("subprocess.Popen", args[:1]))
+            return original(popen, *args, **kwargs)
+        return wrapper
+
+    def patches(self):
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(builtins, "open", self._wrap("open", builtins.open)))
+        stack.enter_context(mock.patch.object(os, "open", self._wrap("os.open", os.open)))
+        stack.enter_context(mock.patch.object(sqlite3, "connect", self._wrap("sqlite3.connect", sqlite3.connect)))
+        stack.enter_context(mock.patch.object(np, "memmap", self._wrap("np.memmap", np.memmap)))
+        stack.enter_context(mock.patch.object(cv2, "VideoCapture", self._wrap("cv2.VideoCapture", cv2.VideoCapture)))
+        stack.enter_context(mock.patch.object(subprocess.Popen, "__init__", self._wrap_popen_init(subprocess.Popen.__init__)))
+        return stack
+
+
+def test_rerun_does_no_io(app_test):
+    counter = IOCounter()
+    with counter.patches():
+        # Changing any widget reruns the whole script, which shouldn't touch the disk, the library or a video
+        app_test.selectbox(key='segment_length').set_value("Every 60 seconds").run()
+        app_test.radio[0].set_value("Anthropic - Claude Opus3").run()
+    assert not app_test.exception
+    assert counter.calls == []
+
+
+def test_sample_is_only_read_when_shown(app_test):
+    counter = IOCounter()
+    with counter.patches():
+        app_test.toggle(key="show_sample").set_value(True).run()
+    assert not app_test.exception
+    assert [call for call in counter.calls if call[0] == "open"], "showing the sample should read it"
+
+
+def test_saved_output_is_only_read_when_shown(app_test, tmp_path):
+    html_path = tmp_path / "Video.html"
+    html_path.write_text("<html><body>Video</body></html>", encoding="utf-8")
+    pdf_path = tmp_path / "Video.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4")
+    app_test.session_state['html_result'] = {
+        'html_path': str(html_path),
+        'html_file_name': html_path.name,
+        'pdf_path': str(pdf_path),
+        'pdf_file_name': pdf_path.name,
+        'metadata': {'title': "Video", 'author': "Author", 'description': ""},
+    }
+
+    counter = IOCounter()
+    with counter.patches():
+        app_test.run()
+    assert not app_test.exception
+    assert counter.calls == []
+
+    with counter.patches():
+        app_test.toggle(key="show_result").set_value(True).run()
+    assert not app_test.exception
+    assert [call for call in counter.calls if call[0] == "open"], "showing the output should read it"
@@ -0,0 +1,55 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from app import summariser
+
+
+def test_send_stream_events_closes_the_stream_once_stopped():
+    closed = threading.Event()
+
+    def pieces():
+        try:
+            for i in range(100):
+                yield f"piece {i}"
+        finally:
+            closed.set()
+
+    events = queue.Queue()
+    stop = threading.Event()
+    stop.set()
+    summariser.send_stream_events("transcript", pieces(), events, stop)
+
+    assert closed.is_set()
+    assert events.empty()
+
+
+def test_failed_summary_stops_the_transcript_stream(monkeypatch):
+    transcript_closed = threading.Event()
+
+    def stream_text(model_choice, build_messages, api_key, model_provider, router=None):
+        messages = build_messages(model_provider)
+        if messages[-1]['content'].startswith("Title"):
+            def failing_summary():
+                time.sleep(0.1)
+                raise RuntimeError("summary failed")
+                yield
+            return failing_summary()
+
+        def endless_transcript():
+            try:
+                while True:
+                    time.sleep(0.01)
+                    yield "word "
+            finally:
+                transcript_closed.set()
+        return endless_transcript()
+
+    monkeypatch.setattr(summariser, "stream_text", stream_text)
+    monkeypatch.setattr(summariser, "split_transcript", lambda text: [text])
+
+    with pytest.raises(RuntimeError, match="summary failed"):
+        summariser.get_summary_in_parallel("a transcript", {'title': "T", 'author': "A", 'description': "D"}, "model", "sk-test", True, "openai")
+    assert transcript_closed.wait(timeout=5)
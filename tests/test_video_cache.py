@@ -0,0 +1,99 @@
+import os
+
+from app.video_cache import VideoCache
+
+
+def write(path, size):
+    with open(path, "wb") as file:
+        file.write(b"\0" * size)
+
+
+def test_entries_skip_files_still_being_written(tmp_path):
+    cache = VideoCache(str(tmp_path), budget_bytes=10 ** 6)
+    video_path = cache.path_for("abc", "best")
+    write(video_path, 100)
+    write(f"{video_path}.frames", 10)
+    write(f"{video_path}.frames.tmp", 1000)
+
+    [(path, size, _, sidecar_paths)] = cache._entries()
+    assert path == video_path
+    assert size == 110
+    assert sidecar_paths == [f"{video_path}.frames"]
+
+
+def test_files_removed_by_another_session_are_tolerated(tmp_path, monkeypatch):
+    cache = VideoCache(str(tmp_path), budget_bytes=10 ** 6)
+    kept_path = cache.path_for("kept", "best")
+    removed_path = cache.path_for("removed", "best")
+    write(kept_path, 100)
+    write(removed_path, 100)
+
+    # The directory listing still names the removed video, as if it was evicted just after being listed
+    listing = os.listdir(tmp_path)
+    os.remove(removed_path)
+    monkeypatch.setattr(os, "listdir", lambda directory: listing)
+
+    assert [path for path, _, _, _ in cache._entries()] == [kept_path]
+    assert cache.stats()['size_bytes'] == 100
+    cache.put(kept_path)
+
+
+def test_least_recently_used_videos_are_evicted_first(tmp_path):
+    cache = VideoCache(str(tmp_path), budget_bytes=250)
+    paths = {video_id: cache.path_for(video_id, "best") for video_id in ("old", "used", "new")}
+    for age, video_id in enumerate(("new", "used", "old")):
+        write(paths[video_id], 100)
+        write(f"{paths[video_id]}.frames", 10)
+        os.utime(paths[video_id], (1000 - age, 1000 - age))
+
+    # Reading "used" makes it the most recently used, so "old" and then "new" are next in line
+    assert cache.get("used", "best") == paths["used"]
+    cache.put(paths["used"])
+
+    assert not os.path.exists(paths["old"])
+    assert not os.path.exists(f"{paths['old']}.frames")
+    assert os.path.exists(paths["new"])
+    assert os.path.exists(paths["used"])
+    assert cache.stats()['size_bytes'] == 220
+
+    cache.budget_bytes = 150
+    cache.put(paths["used"])
+    assert not os.path.exists(paths["new"])
+    assert os.path.exists(paths["used"])
+
+
+def test_videos_in_use_are_not_evicted(tmp_path):
+    cache = VideoCache(str(tmp_path), budget_bytes=150)
+    held_path = cache.path_for("held", "best")
+    new_path = cache.path_for("new", "best")
+    write(held_path, 100)
+    os.utime(held_path, (1000, 1000))
+
+    with cache.in_use("held", "best"):
+        # process_video holds a video while downloading it too, so it can't be evicted before it is read
+        with cache.in_use("new", "best"):
+            write(new_path, 100)
+            cache.put(new_path)
+        # The held video is the oldest, but it is skipped and the cache stays over budget until it is let go
+        assert os.path.exists(held_path)
+        assert os.path.exists(new_path)
+
+    cache.put(new_path)
+    assert not os.path.exists(held_path)
+    assert os.path.exists(new_path)
+
+
+def test_hits_and_misses_are_counted(tmp_path):
+    cache = VideoCache(str(tmp_path), budget_bytes=10 ** 6)
+    assert cache.get("abc", "best") is None
+    assert cache.get("abc", "worst") is None
+
+    write(cache.path_for("abc", "best"), 100)
+    assert cache.get("abc", "best") == cache.path_for("abc", "best")
+    assert cache.get("abc", "best") == cache.path_for("abc", "best")
+    # The same video in another format is a different cache entry
+    assert cache.get("abc", "worst") is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (2, 3)
+    assert stats['size_bytes'] == 100
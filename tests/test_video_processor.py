@@ -0,0 +1,55 @@
+import base64
+import re
+
+import cv2
+import numpy as np
+
+from app.video_processor import create_html_file
+
+URL = "https://www.youtube.com/watch?v=abc123"
+METADATA = {'title': "Video", 'author': "Author", 'description': ""}
+
+
+def write_image(path, shade):
+    cv2.imwrite(str(path), np.full((18, 32, 3), shade, dtype=np.uint8))
+    return path.read_bytes()
+
+
+def entry(start, text):
+    return {'start': start, 'end': start + 30, 'text': text}
+
+
+def rendered_screenshots(html):
+    """Return (mime, image bytes, text) for each screenshot in the rendered page, in page order."""
+    pattern = r'<img src="data:([^;]+);base64,([^"]*)" alt="Screenshot">\s*</div>\s*<pre>[\d.]+ - [\d.]+: ([^<]*)</pre>'
+    return [(mime, base64.b64decode(image), text) for mime, image, text in re.findall(pattern, html)]
+
+
+def test_streamed_render_keeps_screenshots_with_their_text(tmp_path):
+    jpeg = write_image(tmp_path / "screenshot_15.00.jpg", 40)
+    png = write_image(tmp_path / "screenshot_75.00.png", 200)
+    consumed = []
+
+    def segments():
+        # Frame index screenshots are JPEGs and those read from the video are PNGs; one frame couldn't be read
+        # and another's file is gone by the time the template reaches it
+        for screenshot_path, transcript_entry in [
+            (str(tmp_path / "screenshot_15.00.jpg"), entry(0, "first part")),
+            (None, entry(30, "unreadable frame")),
+            (str(tmp_path / "screenshot_75.00.png"), entry(60, "third part")),
+            (str(tmp_path / "screenshot_105.00.jpg"), entry(90, "removed screenshot")),
+        ]:
+            consumed.append(transcript_entry['text'])
+            yield screenshot_path, transcript_entry
+
+    html_path = create_html_file(segments(), METADATA, "Organised transcript", "Summary", URL, str(tmp_path))
+
+    assert consumed == ["first part", "unreadable frame", "third part", "removed screenshot"]
+    with open(html_path, "r", encoding="utf-8") as file:
+        html = file.read()
+    assert rendered_screenshots(html) == [
+        ("image/jpeg", jpeg, "first part"),
+        ("image/png", png, "third part"),
+    ]
+    assert f'href="{URL}&t=60s"' in html
+    assert "unreadable frame" not in html and "removed screenshot" not in html